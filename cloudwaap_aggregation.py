@@ -0,0 +1,78 @@
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from cloudwaap_log_utils import CloudWAAPProcessor
+
+
+class AggregationPlanner:
+    """
+    AggregationPlanner groups pending Cloud WAAP log objects into batches that are merged
+    into a single output: one batch per tenant, log type and time window.
+
+    Objects are placed in a window by the timestamp embedded in their file name, falling
+    back to the object's LastModified time. Windows which have not closed yet are left
+    pending, so that a later sweep picks them up once all their files have arrived.
+    """
+
+    def __init__(self, window_seconds, settle_seconds=0):
+        """
+        Args:
+            window_seconds (int): Length of an aggregation window in seconds.
+            settle_seconds (int): Extra time to wait after a window ends before it is aggregated.
+        """
+        self.window_seconds = max(1, int(window_seconds))
+        self.settle_seconds = max(0, int(settle_seconds))
+
+    def window_start(self, key, last_modified=None):
+        """
+        Return the start of the window an object belongs to as a UTC datetime, or None.
+        """
+        timestamp = CloudWAAPProcessor.parse_log_timestamp(key) or last_modified
+        if timestamp is None:
+            return None
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        epoch = int(timestamp.timestamp())
+        return datetime.fromtimestamp(epoch - epoch % self.window_seconds, tz=timezone.utc)
+
+    def group(self, objects, now=None):
+        """
+        Group listed objects into aggregation batches.
+
+        Args:
+            objects (iterable): Listing entries with "Key" and optionally "LastModified".
+            now (datetime): Current time, defaults to the current UTC time.
+
+        Returns:
+            OrderedDict: (root folder, tenant, log type, window start) -> list of keys, oldest window first.
+        """
+        now = now or datetime.now(timezone.utc)
+        cutoff = now.timestamp() - self.window_seconds - self.settle_seconds
+        batches = {}
+        for item in objects:
+            key = item['Key']
+            window = self.window_start(key, item.get('LastModified'))
+            if window is None or window.timestamp() > cutoff:
+                continue
+            batch_key = (key.split('/')[0],
+                         CloudWAAPProcessor.parse_tenant_name(key),
+                         CloudWAAPProcessor.identify_log_type(key),
+                         window)
+            batches.setdefault(batch_key, []).append(key)
+        return OrderedDict(sorted(batches.items(), key=lambda batch: batch[0][3]))
+
+    @staticmethod
+    def aggregate_key(root_folder, tenant_name, log_type, window, first_key, part):
+        """
+        Build the source-style key an aggregate is named after.
+
+        The key keeps the root folder of the originals, so the destination naming options
+        (folder structure and suffix handling) apply to aggregates as they do to single files.
+        The digest of the first merged key makes the name unique per batch and stable when
+        the same batch is retried.
+        """
+        batch_id = hashlib.blake2b(first_key.encode('utf-8'), digest_size=4).hexdigest()
+        window_label = window.strftime("%Y%m%dH%H%M%S")
+        file_name = f"rdwr_aggregate_{tenant_name}_{log_type}_{window_label}_{batch_id}_{part}.json.gz"
+        return f"{root_folder}/{tenant_name}/aggregated/{log_type}/{file_name}"
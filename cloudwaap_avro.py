@@ -0,0 +1,256 @@
+import json
+import os
+import re
+import struct
+import zlib
+
+MAGIC = b'Obj\x01'
+
+# Column holding the fields of an event that are not in the schema, or do not fit their
+# field type, as a JSON object, so no data is lost when events differ from the first batch
+EXTRA_FIELD = "_extra"
+
+_VALID_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_DOUBLE = struct.Struct('<d')
+_MISMATCH = object()
+_LONG_MIN = -(1 << 63)
+_LONG_MAX = (1 << 63) - 1
+
+
+def encode_long(value):
+    """
+    Encode an integer as an Avro long: zig-zag, then a variable-length base-128 integer.
+    """
+    value = (value << 1) ^ (value >> 63)
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def encode_string(value):
+    """
+    Encode a string (or bytes) as Avro string/bytes: length, then the UTF-8 data.
+    """
+    data = value.encode('utf-8') if isinstance(value, str) else value
+    return encode_long(len(data)) + data
+
+
+# Encoders of the non-null branch of a ["null", type] union; the branch index is 1
+def _encode_boolean(value):
+    if isinstance(value, bool):
+        return b'\x02\x01' if value else b'\x02\x00'
+    return _MISMATCH
+
+
+def _encode_long(value):
+    if type(value) is int and _LONG_MIN <= value <= _LONG_MAX:
+        return b'\x02' + encode_long(value)
+    if isinstance(value, float) and value.is_integer() and _LONG_MIN <= value <= _LONG_MAX:
+        return b'\x02' + encode_long(int(value))
+    return _MISMATCH
+
+
+def _encode_double(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return b'\x02' + _DOUBLE.pack(value)
+    return _MISMATCH
+
+
+def _encode_string(value):
+    if not isinstance(value, str):
+        value = json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+    return b'\x02' + encode_string(value)
+
+
+_ENCODERS = {"boolean": _encode_boolean, "long": _encode_long, "double": _encode_double, "string": _encode_string}
+
+
+def _infer_type(values):
+    kinds = {type(value) for value in values if value is not None}
+    if kinds == {bool}:
+        return "boolean"
+    if kinds == {int}:
+        return "long"
+    if kinds and kinds <= {int, float}:
+        return "double"
+    return "string"
+
+
+def infer_schema(log_type, events):
+    """
+    Infer a record schema from a batch of events.
+
+    Every top-level field with a valid Avro name becomes a nullable field, typed as
+    boolean, long or double when all values of the batch are, otherwise as string (nested
+    objects and lists as JSON text). The extra field comes last.
+
+    Args:
+        log_type (str): Log type, used as the record name.
+        events (list): Event dictionaries.
+
+    Returns:
+        dict: The Avro schema.
+    """
+    values = {}
+    for event in events:
+        for name, value in event.items():
+            values.setdefault(name, []).append(value)
+    values.pop(EXTRA_FIELD, None)
+    record_name = re.sub(r'[^A-Za-z0-9_]', '_', log_type or "Unknown")
+    if not _VALID_NAME.match(record_name):
+        record_name = f"_{record_name}"
+    fields = [{"name": name, "type": ["null", _infer_type(field_values)], "default": None}
+              for name, field_values in values.items() if _VALID_NAME.match(name)]
+    fields.append({"name": EXTRA_FIELD, "type": ["null", "string"], "default": None})
+    return {"type": "record", "name": record_name, "namespace": "com.radware.cloudwaap", "fields": fields}
+
+
+class AvroEventWriter:
+    """
+    AvroEventWriter writes log events into a local Avro Object Container File, without
+    any Avro library.
+
+    Records are encoded as they are written and collected into blocks of about
+    `block_size` bytes, each compressed with the deflate codec, so memory stays bounded by
+    one block. The schema of a log type is inferred from the first events written for it
+    (up to INFER_EVENTS) and then reused for all files of the log type in the container,
+    so the files of a table share one schema. It has the same interface as EventWriter.
+    """
+
+    INFER_EVENTS = 1000
+    CODECS = ("deflate", "null")
+
+    def __init__(self, path, log_type, schemas, codec='deflate', block_size=64 * 1024):
+        """
+        Args:
+            path (str): Local path of the output file.
+            log_type (str): Log type of the events, selecting the schema.
+            schemas (dict): Log type -> schema, shared by the writers of a destination.
+            codec (str): Block codec: "deflate" or "null".
+            block_size (int): Uncompressed size of a block in bytes.
+
+        Raises:
+            ValueError: If the codec is not supported.
+        """
+        if codec not in self.CODECS:
+            raise ValueError(f"Unsupported Avro codec '{codec}'")
+        self.path = path
+        self.log_type = log_type
+        self.codec = codec
+        self.block_size = max(1, int(block_size))
+        self.event_count = 0
+        self.blocks = 0
+        self._schemas = schemas
+        self._file = open(path, 'wb')
+        self._sync = os.urandom(16)
+        self._pending = []
+        self._encoders = None
+        self._block = []
+        self._block_bytes = 0
+        if schemas.get(log_type) is not None:
+            self._start()
+
+    @property
+    def size(self):
+        """
+        Approximate number of bytes written to the local file so far.
+        """
+        return self._file.tell()
+
+    def _start(self):
+        schema = self._schemas.get(self.log_type)
+        if schema is None:
+            schema = infer_schema(self.log_type, self._pending)
+            if self._pending:
+                self._schemas[self.log_type] = schema
+        self.schema = schema
+        self._encoders = tuple((field["name"], _ENCODERS[field["type"][1]]) for field in schema["fields"]
+                               if field["name"] != EXTRA_FIELD)
+        self._names = frozenset(name for name, _ in self._encoders)
+        self._write_header()
+        pending, self._pending = self._pending, []
+        for event in pending:
+            self._append(event)
+
+    def _write_header(self):
+        metadata = {"avro.schema": json.dumps(self.schema).encode('utf-8'), "avro.codec": self.codec.encode('utf-8')}
+        header = [MAGIC, encode_long(len(metadata))]
+        for key, value in metadata.items():
+            header.append(encode_string(key))
+            header.append(encode_string(value))
+        header.append(b'\x00')
+        header.append(self._sync)
+        self._file.write(b''.join(header))
+
+    def write(self, event, encoded=None):
+        """
+        Append a single event. `encoded` is accepted for compatibility with EventWriter.
+        """
+        self.event_count += 1
+        if self._encoders is None:
+            # Events are kept until enough of them are seen to infer the schema
+            self._pending.append(event)
+            if len(self._pending) >= self.INFER_EVENTS:
+                self._start()
+            return
+        self._append(event)
+
+    def write_events(self, events):
+        """
+        Append all events of an iterable.
+        """
+        for event in events:
+            self.write(event)
+
+    def _append(self, event):
+        parts = []
+        extra = None
+        for name, encode in self._encoders:
+            value = event.get(name)
+            if value is None:
+                parts.append(b'\x00')
+                continue
+            data = encode(value)
+            if data is _MISMATCH:
+                extra = extra or {}
+                extra[name] = value
+                data = b'\x00'
+            parts.append(data)
+        if len(event) > len(self._names) or not self._names.issuperset(event):
+            extra = extra or {}
+            for name, value in event.items():
+                if name not in self._names:
+                    extra[name] = value
+        parts.append(_encode_string(json.dumps(extra)) if extra else b'\x00')
+        record = b''.join(parts)
+        self._block.append(record)
+        self._block_bytes += len(record)
+        if self._block_bytes >= self.block_size:
+            self._write_block()
+
+    def _write_block(self):
+        if not self._block:
+            return
+        data = b''.join(self._block)
+        if self.codec == "deflate":
+            # Avro's deflate codec is raw deflate, without zlib header and checksum
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            data = compressor.compress(data) + compressor.flush()
+        self._file.write(b''.join((encode_long(len(self._block)), encode_long(len(data)), data, self._sync)))
+        self.blocks += 1
+        self._block = []
+        self._block_bytes = 0
+
+    def close(self):
+        """
+        Write the remaining events, so that the file can be uploaded.
+        """
+        if self._file.closed:
+            return
+        if self._encoders is None:
+            self._start()
+        self._write_block()
+        self._file.close()
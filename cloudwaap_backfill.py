@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import json
+import os
+
+
+class BackfillManifest:
+    """
+    BackfillManifest keeps track of the progress of a backfill run over an S3 prefix.
+
+    The manifest only holds the continuation token of the listing page currently being
+    processed and a set of short key digests for the objects of that page which were
+    already delivered. When a page is finished the token advances and the set is reset,
+    so the manifest stays a few kilobytes large no matter how many keys are backfilled.
+    Failed objects are counted, and only the last MAX_FAILED_KEYS of them are named.
+    Writes are batched: the manifest is persisted every `checkpoint_interval` completed
+    objects, when a page is finished and when the run stops.
+    """
+
+    VERSION = 1
+    DIGEST_SIZE = 8
+    MAX_FAILED_KEYS = 100
+
+    def __init__(self, location, bucket, prefix, s3_client=None, checkpoint_interval=100):
+        """
+        Args:
+            location (str): Local file path or "s3://bucket/key" URI of the manifest.
+            bucket (str): The bucket being backfilled.
+            prefix (str): The key prefix being backfilled.
+            s3_client: S3 client used when the manifest is stored in S3.
+            checkpoint_interval (int): Number of completed objects between manifest writes.
+        """
+        self.location = location
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_client = s3_client
+        self.checkpoint_interval = max(1, int(checkpoint_interval))
+        self.continuation_token = None
+        self.page = 0
+        self.processed = 0
+        self.failed_count = 0
+        self.failed = []
+        self.complete = False
+        self._done = set()
+        self._pending_writes = 0
+
+    @staticmethod
+    def default_location(bucket, prefix):
+        """
+        Build the default manifest location for a backfill of `bucket`/`prefix`.
+
+        Returns:
+            str: An "s3://" URI in the source bucket, outside of the backfilled prefix.
+        """
+        prefix_id = hashlib.sha1(f"{bucket}/{prefix}".encode('utf-8')).hexdigest()[:16]
+        return f"s3://{bucket}/cloudwaap-backfill/{prefix_id}.json"
+
+    @staticmethod
+    def key_digest(key):
+        """
+        Return the short digest used to remember a completed key.
+        """
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=BackfillManifest.DIGEST_SIZE).digest()
+
+    def _split_s3_location(self):
+        bucket, _, key = self.location[len("s3://"):].partition('/')
+        return bucket, key
+
+    def load(self):
+        """
+        Load a previously saved manifest. A missing manifest, or one that belongs to a
+        different bucket/prefix, starts the backfill from the beginning.
+
+        Returns:
+            BackfillManifest: self, to allow chaining.
+        """
+        raw = None
+        try:
+            if self.location.startswith("s3://"):
+                manifest_bucket, manifest_key = self._split_s3_location()
+                response = self.s3_client.get_object(Bucket=manifest_bucket, Key=manifest_key)
+                raw = response['Body'].read()
+            elif os.path.exists(self.location):
+                with open(self.location, 'rb') as f:
+                    raw = f.read()
+        except Exception as e:
+            error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if error_code not in ('NoSuchKey', '404'):
+                raise
+        if not raw:
+            print(f"No backfill manifest found at {self.location}, starting from the beginning.")
+            return self
+
+        state = json.loads(raw)
+        if state.get('bucket') != self.bucket or state.get('prefix') != self.prefix:
+            print(f"Backfill manifest at {self.location} belongs to another prefix, ignoring it.")
+            return self
+
+        self.continuation_token = state.get('token')
+        self.page = state.get('page', 0)
+        self.processed = state.get('processed', 0)
+        self.failed = state.get('failed', [])[-self.MAX_FAILED_KEYS:]
+        self.failed_count = state.get('failed_count', len(self.failed))
+        self.complete = state.get('complete', False)
+        packed = base64.b64decode(state.get('done', ''))
+        self._done = {packed[i:i + self.DIGEST_SIZE] for i in range(0, len(packed), self.DIGEST_SIZE)}
+        if self.complete:
+            print(f"Backfill manifest at {self.location} is already complete.")
+        else:
+            print(f"Resuming backfill from page {self.page} with {len(self._done)} completed keys on that page.")
+        return self
+
+    def save(self):
+        """
+        Persist the manifest, either to the local file system or to S3.
+        """
+        state = {
+            'version': self.VERSION,
+            'bucket': self.bucket,
+            'prefix': self.prefix,
+            'token': self.continuation_token,
+            'page': self.page,
+            'processed': self.processed,
+            'failed_count': self.failed_count,
+            'failed': self.failed,
+            'complete': self.complete,
+            'done': base64.b64encode(b''.join(sorted(self._done))).decode('ascii'),
+        }
+        body = json.dumps(state, separators=(',', ':')).encode('utf-8')
+        if self.location.startswith("s3://"):
+            manifest_bucket, manifest_key = self._split_s3_location()
+            self.s3_client.put_object(Bucket=manifest_bucket, Key=manifest_key, Body=body,
+                                      ContentType='application/json')
+        else:
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.location}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(body)
+            os.replace(temp_path, self.location)
+        self._pending_writes = 0
+
+    def is_done(self, key):
+        """
+        Check whether `key` was already delivered on the current listing page.
+        """
+        return self.key_digest(key) in self._done
+
+    def mark_done(self, key):
+        """
+        Record `key` as delivered and persist the manifest once enough keys have accumulated.
+        """
+        self._done.add(self.key_digest(key))
+        self.processed += 1
+        self._pending_writes += 1
+        if self._pending_writes >= self.checkpoint_interval:
+            self.save()
+
+    def mark_failed(self, key):
+        """
+        Record `key` as failed so it is reported, without blocking the rest of the page.
+        Only the last MAX_FAILED_KEYS failed keys are kept.
+        """
+        if key not in self.failed:
+            self.failed_count += 1
+            self.failed.append(key)
+            del self.failed[:-self.MAX_FAILED_KEYS]
+            self._pending_writes += 1
+
+    def advance(self, next_token):
+        """
+        Move to the next listing page and persist the new position.
+        """
+        self.continuation_token = next_token
+        self.page += 1
+        self._done = set()
+        self.save()
+
+    def finish(self):
+        """
+        Mark the backfill as complete and persist the manifest.
+        """
+        self.complete = True
+        self.continuation_token = None
+        self._done = set()
+        self.save()
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+
+
+class Continuation:
+    """
+    Continuation tracks how far a log file got, so that a file which would outlive the
+    function timeout is stopped in time and continued by a later invocation.
+
+    The events of the file pass through watch(), which checks the remaining Lambda time
+    every `check_interval` events and ends the stream early once less than
+    `time_buffer_ms` remain and another event follows. The pipeline then drains and delivers what it holds, and the
+    position after the last event read (see CloudWAAPProcessor.iter_events) is saved with
+    the number of the next segment. Gzip streams cannot be entered in the middle, so a
+    continued invocation inflates the file again up to the saved offset, but skips the
+    decoding, transformation and delivery of the events before it.
+    """
+
+    VERSION = 1
+
+    def __init__(self, bucket, key, version=None, context=None, time_buffer_ms=60000, check_interval=1000):
+        """
+        Args:
+            bucket (str): Name of the source bucket.
+            key (str): Key of the log object.
+            version (str): ETag of the object; a saved position of another version is ignored.
+            context: Lambda context; without one the stream is never stopped.
+            time_buffer_ms (int): Remaining time at which the stream is stopped.
+            check_interval (int): Number of events between checks of the remaining time.
+        """
+        self.bucket = bucket
+        self.key = key
+        self.version = version.strip('"') if version else None
+        self.context = context
+        self.time_buffer_ms = time_buffer_ms
+        self.check_interval = max(1, int(check_interval))
+        self.cursor = {}
+        self.events = 0
+        self.segment = 0
+        self.stopped = False
+
+    @property
+    def resumed(self):
+        """
+        True if earlier invocations already delivered part of the file.
+        """
+        return self.segment > 0
+
+    def restore(self, record):
+        """
+        Continue from a record saved by an earlier invocation.
+
+        Returns:
+            bool: False if the record belongs to another object or version and was ignored.
+        """
+        if (record.get('version') != self.VERSION or record.get('bucket') != self.bucket
+                or record.get('key') != self.key or record.get('etag') != self.version):
+            return False
+        self.cursor = dict(record['cursor'])
+        self.events = record['events']
+        self.segment = record['segment']
+        return True
+
+    def to_record(self):
+        """
+        Return the record that lets the next invocation continue after the last event read.
+        """
+        return {
+            'version': self.VERSION,
+            'bucket': self.bucket,
+            'key': self.key,
+            'etag': self.version,
+            'cursor': self.cursor,
+            'events': self.events,
+            'segment': self.segment + 1,
+        }
+
+    def watch(self, events):
+        """
+        Pass the events of the file through until the remaining time runs low.
+
+        Args:
+            events (iterator): Events decoded by CloudWAAPProcessor.iter_events with self.cursor.
+
+        Yields:
+            dict: The events, counted in self.events.
+        """
+        self.stopped = False
+        events = iter(events)
+        read = 0
+        for event in events:
+            read += 1
+            self.events += 1
+            yield event
+            if (self.context is not None and read % self.check_interval == 0
+                    and self.context.get_remaining_time_in_millis() < self.time_buffer_ms):
+                # The stream is only stopped if an event follows, so a file ending here is completed.
+                # That event is still passed on, and the cursor points right after it.
+                for event in events:
+                    self.events += 1
+                    self.stopped = True
+                    yield event
+                    break
+                return
+
+    def progress(self):
+        """
+        Describe the position reached, for logging.
+        """
+        return f"{self.events} events ({self.cursor.get('offset', 0)} characters)"
+
+
+class ContinuationStore:
+    """
+    ContinuationStore keeps the continuation records of files stopped before the timeout,
+    for callers that cannot hand the record to the next invocation themselves (backfill).
+
+    Records are small JSON documents named after a digest of the bucket and key, kept
+    under an "s3://bucket/prefix/" location, so that any container can continue the file,
+    or in a local directory (tests, single container).
+    """
+
+    def __init__(self, location, s3_client=None):
+        """
+        Args:
+            location (str): "s3://bucket/prefix/" or a local directory.
+            s3_client: S3 client used for S3 locations.
+        """
+        self.location = location
+        self.s3_client = s3_client
+
+    def _name(self, bucket, key):
+        return hashlib.sha1(f"{bucket}/{key}".encode('utf-8')).hexdigest()[:16] + '.json'
+
+    def _split_s3_location(self, bucket, key):
+        record_bucket, _, prefix = self.location[len("s3://"):].partition('/')
+        return record_bucket, prefix + self._name(bucket, key)
+
+    def load(self, bucket, key):
+        """
+        Load the record of an object.
+
+        Returns:
+            dict or None: The record, or None if the object has none.
+        """
+        try:
+            if self.location.startswith("s3://"):
+                record_bucket, record_key = self._split_s3_location(bucket, key)
+                raw = self.s3_client.get_object(Bucket=record_bucket, Key=record_key)['Body'].read()
+            else:
+                path = os.path.join(self.location, self._name(bucket, key))
+                if not os.path.exists(path):
+                    return None
+                with open(path, 'rb') as f:
+                    raw = f.read()
+        except Exception as e:
+            error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            # Without ListBucket permission S3 answers a missing key with AccessDenied
+            if error_code in ('NoSuchKey', '404', 'AccessDenied', '403'):
+                return None
+            raise
+        return json.loads(raw)
+
+    def save(self, record):
+        """
+        Persist the record of an object, replacing an earlier one.
+        """
+        body = json.dumps(record, separators=(',', ':')).encode('utf-8')
+        if self.location.startswith("s3://"):
+            record_bucket, record_key = self._split_s3_location(record['bucket'], record['key'])
+            self.s3_client.put_object(Bucket=record_bucket, Key=record_key, Body=body, ContentType='application/json')
+            return
+        os.makedirs(self.location, exist_ok=True)
+        path = os.path.join(self.location, self._name(record['bucket'], record['key']))
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(body)
+        os.replace(f"{path}.tmp", path)
+
+    def delete(self, bucket, key):
+        """
+        Remove the record of an object that was completed.
+        """
+        if self.location.startswith("s3://"):
+            record_bucket, record_key = self._split_s3_location(bucket, key)
+            self.s3_client.delete_object(Bucket=record_bucket, Key=record_key)
+            return
+        path = os.path.join(self.location, self._name(bucket, key))
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def invoke_continuation(client, function_arn, payload):
+    """
+    Invoke a function asynchronously with a continuation request.
+
+    Args:
+        client: Lambda client, see cloudwaap_s3.create_lambda_client().
+        function_arn (str): ARN of the function, usually context.invoked_function_arn.
+        payload (dict): Event of the new invocation.
+    """
+    client.invoke(FunctionName=function_arn, InvocationType='Event', Payload=json.dumps(payload).encode('utf-8'))
@@ -0,0 +1,360 @@
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+
+# Value of a log type's field list selecting the whole event instead of some fields
+RAW = "raw"
+
+
+def _fingerprinter(fields):
+    """
+    Compile the fingerprint function of a log type: a 64-bit integer from the configured
+    fields, or from the whole event serialized with sorted keys.
+    """
+    if fields == RAW:
+        def serialize(event):
+            return json.dumps(event, sort_keys=True, separators=(',', ':'), default=str)
+    else:
+        fields = tuple(fields)
+
+        def serialize(event):
+            return json.dumps([event.get(field) for field in fields], separators=(',', ':'), default=str)
+
+    def fingerprint(event):
+        digest = hashlib.blake2b(serialize(event).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+    return fingerprint
+
+
+class RotatingBloomFilter:
+    """
+    RotatingBloomFilter remembers 64-bit fingerprints for a sliding time window.
+
+    The window is split into `generations` Bloom filters, each receiving the fingerprints
+    added during `generation_seconds`. A fingerprint is known while any live generation
+    contains it; the oldest generation is dropped as time moves on, so memory stays fixed.
+    Each generation is sized for `capacity` fingerprints at the target false-positive
+    rate, and the k bit positions are derived from the two halves of the fingerprint.
+    """
+
+    VERSION = 1
+
+    def __init__(self, capacity, error_rate, generation_seconds, generations):
+        """
+        Args:
+            capacity (int): Fingerprints per generation the filter is sized for.
+            error_rate (float): Target false-positive rate of a full generation.
+            generation_seconds (float): Time span of a generation.
+            generations (int): Number of live generations.
+        """
+        capacity = max(1, int(capacity))
+        bits = -capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self.bits = max(64, int(math.ceil(bits / 8)) * 8)
+        self.hashes = max(1, int(round(self.bits / capacity * math.log(2))))
+        self.generation_seconds = max(1.0, float(generation_seconds))
+        self.generations = max(1, int(generations))
+        # Generation number -> [bit array, number of fingerprints added]
+        self._filters = OrderedDict()
+
+    def _positions(self, fingerprint):
+        first = fingerprint & 0xFFFFFFFF
+        second = (fingerprint >> 32) | 1
+        bits = self.bits
+        return [(first + i * second) % bits for i in range(self.hashes)]
+
+    def _contains(self, bit_array, first, second):
+        # Probes stop at the first unset bit, which for unseen fingerprints is usually the first one
+        bits = self.bits
+        position = first
+        for _ in range(self.hashes):
+            bit = position % bits
+            if not bit_array[bit >> 3] & (1 << (bit & 7)):
+                return False
+            position += second
+        return True
+
+    def _rotate(self, now):
+        current = int(now // self.generation_seconds)
+        for generation in list(self._filters):
+            if generation <= current - self.generations:
+                del self._filters[generation]
+        if current not in self._filters:
+            self._filters[current] = [bytearray(self.bits // 8), 0]
+        return current
+
+    def __contains__(self, fingerprint):
+        first = fingerprint & 0xFFFFFFFF
+        second = (fingerprint >> 32) | 1
+        for bit_array, _ in self._filters.values():
+            if self._contains(bit_array, first, second):
+                return True
+        return False
+
+    def add_many(self, fingerprints, now=None):
+        """
+        Add fingerprints to the current generation.
+        """
+        current = self._rotate(time.time() if now is None else now)
+        entry = self._filters[current]
+        bit_array = entry[0]
+        for fingerprint in fingerprints:
+            for position in self._positions(fingerprint):
+                bit_array[position >> 3] |= 1 << (position & 7)
+            entry[1] += 1
+
+    def expire(self, now=None):
+        """
+        Drop the generations that left the window.
+        """
+        self._rotate(time.time() if now is None else now)
+
+    def false_positive_rate(self):
+        """
+        Estimate the probability that an unseen fingerprint is reported as known, from the
+        number of fingerprints in each live generation.
+        """
+        log_miss = 0.0
+        for _, count in self._filters.values():
+            rate = (-math.expm1(-self.hashes * count / self.bits)) ** self.hashes
+            log_miss += math.log1p(-min(rate, 1.0 - 1e-16))
+        return -math.expm1(log_miss)
+
+    def merge(self, other):
+        """
+        Add the fingerprints of another filter with the same parameters (bitwise OR).
+        """
+        for generation, (bit_array, count) in other._filters.items():
+            entry = self._filters.get(generation)
+            if entry is None:
+                self._filters[generation] = [bytearray(bit_array), count]
+                continue
+            merged = int.from_bytes(entry[0], 'little') | int.from_bytes(bit_array, 'little')
+            entry[0] = bytearray(merged.to_bytes(len(bit_array), 'little'))
+            entry[1] = max(entry[1], count)
+        self._filters = OrderedDict(sorted(self._filters.items()))
+
+    def to_bytes(self):
+        """
+        Serialize the filter: a JSON header line followed by the bit arrays.
+        """
+        header = {'version': self.VERSION, 'bits': self.bits, 'hashes': self.hashes,
+                  'generation_seconds': self.generation_seconds,
+                  'generations': [[generation, count] for generation, (_, count) in self._filters.items()]}
+        return b''.join([json.dumps(header).encode('utf-8'), b'\n'] +
+                        [bit_array for bit_array, _ in self._filters.values()])
+
+    def load_bytes(self, data):
+        """
+        Load a filter serialized by to_bytes().
+
+        Returns:
+            bool: False if the data was written with other parameters, or is truncated, and was ignored.
+        """
+        header_line, _, body = data.partition(b'\n')
+        header = json.loads(header_line)
+        if (header.get('version') != self.VERSION or header['bits'] != self.bits or header['hashes'] != self.hashes
+                or header['generation_seconds'] != self.generation_seconds):
+            return False
+        size = self.bits // 8
+        if len(body) != len(header['generations']) * size:
+            return False
+        self._filters = OrderedDict()
+        for index, (generation, count) in enumerate(header['generations']):
+            self._filters[generation] = [bytearray(body[index * size:(index + 1) * size]), count]
+        return True
+
+
+class EventDeduplicator:
+    """
+    EventDeduplicator drops events that were already delivered from an earlier file, e.g.
+    when Cloud WAAP ships an overlapping time window again.
+
+    Every event is reduced to a 64-bit fingerprint of the configured fields of its log type
+    (or of the whole event) and looked up in the rotating Bloom filter of its tenant, which
+    covers the last `window_seconds`. Only fingerprints of earlier files are looked up, so
+    identical events within one file are kept. Fingerprints of the events that pass are
+    only added to the filter by commit(), once the file was delivered, so a failed file is
+    not deduplicated against itself when it is retried.
+
+    Filters are loaded on first use and persisted by commit() at most every
+    `save_interval` seconds, to the state directory or to "s3://bucket/prefix/". S3 copies
+    are refreshed with conditional reads, and written with a conditional write that only
+    succeeds if nobody else wrote in between; otherwise the other copy is merged and the
+    write is retried, so concurrent containers keep each other's fingerprints.
+    """
+
+    SAVE_ATTEMPTS = 5
+
+    def __init__(self, fields, location='', window_seconds=3600, generations=4, capacity=100000,
+                 error_rate=0.001, s3_client=None, state_dir='/tmp', save_interval=60):
+        """
+        Args:
+            fields (dict): Log type ("*" for all) -> list of fields, or "raw" for the whole event.
+            location (str): "s3://bucket/prefix/" to share the filters, or "" for the state directory.
+            window_seconds (int): Time for which delivered events are remembered.
+            generations (int): Number of Bloom filter generations the window is split into.
+            capacity (int): Events per tenant and generation the filters are sized for.
+            error_rate (float): Target false-positive rate of a full generation.
+            s3_client: S3 client, required for S3 locations.
+            state_dir (str): Directory of local filters.
+            save_interval (float): Minimum time between two writes of a tenant's filter.
+        """
+        self._fingerprinters = {log_type: _fingerprinter(log_fields) for log_type, log_fields in fields.items()}
+        self.location = location
+        self.s3_client = s3_client
+        self.state_dir = state_dir
+        self._filter_options = (capacity, error_rate, window_seconds / max(1, int(generations)), generations)
+        self.save_interval = save_interval
+        # Tenant -> [filter, ETag of the S3 copy, time of the last write]
+        self._filters = {}
+        # (tenant, fingerprint) of the events passed since the last commit
+        self._pending = []
+        # Tenants whose filters have fingerprints that were not written yet
+        self._dirty = set()
+        self.checked = 0
+        self.duplicates = 0
+
+    def applies_to(self, log_type):
+        """
+        Return True if events of the log type are deduplicated.
+        """
+        return log_type in self._fingerprinters or "*" in self._fingerprinters
+
+    def _state_name(self, tenant):
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', tenant or 'unknown') + '.bloom'
+
+    def _load(self, tenant):
+        entry = self._filters.get(tenant)
+        if entry is None:
+            entry = self._filters[tenant] = [RotatingBloomFilter(*self._filter_options), None, 0.0]
+            if not self.location:
+                path = os.path.join(self.state_dir, 'dedup', self._state_name(tenant))
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        if not entry[0].load_bytes(f.read()):
+                            print(f"Ignoring the deduplication filter of tenant {tenant}, "
+                                  f"it was written with other parameters or is truncated.")
+                return entry[0]
+        if self.location:
+            # Other containers' fingerprints are picked up whenever the S3 copy changed
+            remote = self._fetch(tenant, entry[1])
+            if remote is not None:
+                entry[0].merge(remote[0])
+                entry[1] = remote[1]
+        return entry[0]
+
+    def _fetch(self, tenant, etag):
+        bucket, _, prefix = self.location[len("s3://"):].partition('/')
+        request = {'Bucket': bucket, 'Key': prefix + self._state_name(tenant)}
+        if etag:
+            request['IfNoneMatch'] = etag
+        try:
+            response = self.s3_client.get_object(**request)
+        except Exception as e:
+            error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if error_code in ('304', 'NotModified', 'NoSuchKey', '404'):
+                return None
+            raise
+        remote = RotatingBloomFilter(*self._filter_options)
+        if not remote.load_bytes(response['Body'].read()):
+            print(f"Ignoring the deduplication filter of tenant {tenant}, "
+                  f"it was written with other parameters or is truncated.")
+        return remote, response.get('ETag')
+
+    def apply(self, events, log_type, tenant):
+        """
+        Drop the events of a stream that were seen before.
+
+        Returns:
+            generator: The events that were not seen before.
+        """
+        fingerprint = self._fingerprinters.get(log_type) or self._fingerprinters["*"]
+        bloom = self._load(tenant)
+        bloom.expire()
+        pending = self._pending
+        for event in events:
+            self.checked += 1
+            value = fingerprint(event)
+            if value in bloom:
+                self.duplicates += 1
+                continue
+            pending.append((tenant, value))
+            yield event
+
+    def savepoint(self):
+        """
+        Return a marker of the pending fingerprints, for rollback().
+        """
+        return len(self._pending)
+
+    def rollback(self, savepoint=0):
+        """
+        Forget the pending fingerprints added after a savepoint, e.g. of a file that failed.
+        """
+        del self._pending[savepoint:]
+        if not savepoint:
+            self.checked = self.duplicates = 0
+
+    def commit(self):
+        """
+        Add the pending fingerprints to their tenants' filters, persist the filters not
+        written for `save_interval` seconds and report the duplicate and estimated
+        false-positive rates.
+        """
+        by_tenant = {}
+        for tenant, value in self._pending:
+            by_tenant.setdefault(tenant, []).append(value)
+        now = time.time()
+        for tenant, values in by_tenant.items():
+            self._load(tenant).add_many(values, now)
+            self._dirty.add(tenant)
+        for tenant in list(self._dirty):
+            if now - self._filters[tenant][2] >= self.save_interval:
+                self._save(tenant)
+        if self.checked:
+            rates = ", ".join(f"{tenant}: {self._filters[tenant][0].false_positive_rate():.2e}"
+                              for tenant in sorted(by_tenant))
+            print(f"Dropped {self.duplicates} duplicate events of {self.checked} "
+                  f"({100.0 * self.duplicates / self.checked:.2f}%); estimated false-positive rate {rates or 'n/a'}.")
+        self._pending = []
+        self.checked = self.duplicates = 0
+
+    def _save(self, tenant):
+        entry = self._filters[tenant]
+        entry[2] = time.time()
+        self._dirty.discard(tenant)
+        if not self.location:
+            path = os.path.join(self.state_dir, 'dedup', self._state_name(tenant))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(entry[0].to_bytes())
+            os.replace(f"{path}.tmp", path)
+            return
+        bucket, _, prefix = self.location[len("s3://"):].partition('/')
+        for _ in range(self.SAVE_ATTEMPTS):
+            # The write only succeeds if the S3 copy is still the one merged last
+            request = {'Bucket': bucket, 'Key': prefix + self._state_name(tenant), 'Body': entry[0].to_bytes()}
+            if entry[1]:
+                request['IfMatch'] = entry[1]
+            else:
+                request['IfNoneMatch'] = '*'
+            try:
+                entry[1] = self.s3_client.put_object(**request).get('ETag')
+                return
+            except Exception as e:
+                error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+                if error_code not in ('PreconditionFailed', '412', 'ConditionalRequestConflict', '409'):
+                    raise
+            remote = self._fetch(tenant, None)
+            if remote is None:
+                entry[1] = None
+            else:
+                entry[0].merge(remote[0])
+                entry[1] = remote[1]
+        print(f"Could not write the deduplication filter of tenant {tenant}, it changed concurrently; "
+              f"retrying with the next commit.")
+        self._dirty.add(tenant)
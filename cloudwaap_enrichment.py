@@ -0,0 +1,229 @@
+import csv
+import io
+import json
+import os
+import time
+
+
+class MappingFile:
+    """
+    MappingFile is a key -> value table loaded from a local file or an S3 object, such as
+    the mapping of application IDs to application names.
+
+    The table is loaded once per container and kept in a dict. After `ttl_seconds` the
+    source is checked for changes: S3 objects with a conditional GET on the ETag (an
+    unchanged object costs a 304 response without a body), local files by modification
+    time. If the source cannot be read, the previous table stays in use.
+
+    The file is either a JSON object ({"<id>": "<name>", ...}) or, for a ".csv" file, rows
+    of "id,name".
+    """
+
+    def __init__(self, location, ttl_seconds=300, s3_client=None):
+        """
+        Args:
+            location (str): Local file path or "s3://bucket/key" URI of the mapping.
+            ttl_seconds (int): Seconds between checks for a changed mapping.
+            s3_client: S3 client, required for S3 locations.
+        """
+        self.location = location
+        self.ttl_seconds = ttl_seconds
+        self.s3_client = s3_client
+        self.table = {}
+        self.version = None
+        self.loads = 0
+        self._checked_at = None
+
+    def get(self, key, default=None):
+        """
+        Return the value for a key, refreshing the table first if its TTL has expired.
+        """
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.ttl_seconds:
+            self._checked_at = now
+            self.refresh()
+        return self.table.get(key, default)
+
+    def refresh(self):
+        """
+        Reload the table if the source changed since it was last loaded.
+
+        Returns:
+            bool: True if a new table was loaded.
+        """
+        try:
+            raw, version = self._read_if_changed()
+        except Exception as e:
+            print(f"Error loading mapping from {self.location}, keeping {len(self.table)} entries: {e}")
+            return False
+        if raw is None:
+            return False
+        self.table = self._parse(raw)
+        self.version = version
+        self.loads += 1
+        print(f"Loaded {len(self.table)} entries from mapping {self.location}.")
+        return True
+
+    def _read_if_changed(self):
+        if self.location.startswith("s3://"):
+            bucket, _, key = self.location[len("s3://"):].partition('/')
+            request = {'Bucket': bucket, 'Key': key}
+            if self.version:
+                request['IfNoneMatch'] = self.version
+            try:
+                response = self.s3_client.get_object(**request)
+            except Exception as e:
+                error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+                if error_code in ('304', 'NotModified'):
+                    return None, self.version
+                raise
+            return response['Body'].read(), response.get('ETag')
+
+        modified = os.stat(self.location).st_mtime_ns
+        if modified == self.version:
+            return None, self.version
+        with open(self.location, 'rb') as f:
+            return f.read(), modified
+
+    def _parse(self, raw):
+        text = raw.decode('utf-8-sig')
+        if self.location.lower().endswith('.csv'):
+            return {row[0].strip(): row[1].strip() for row in csv.reader(io.StringIO(text))
+                    if len(row) >= 2 and row[0].strip()}
+        return {str(key): value for key, value in json.loads(text).items()}
+
+
+class EnrichmentPlanner:
+    """
+    EnrichmentPlanner compiles the enrichment of log events into plans, one per log type,
+    tenant and application.
+
+    A plan is a single generator function enriching the event stream of a file. All
+    decisions that only depend on the file (which metadata fields apply to the log type,
+    their values, the static fields) are taken once when the plan is compiled, leaving the
+    per-event work to a few assignments and membership checks.
+
+    Fields are added in three ways:
+        overwrite   Always set, e.g. "logType".
+        default     Set when the event does not already have the field, e.g. "tenantName".
+        lookup      Looked up in a table by the value of another event field, e.g.
+                    {"actionCategory": {"source": "action", "values": {"Blocked": "deny"}}}.
+                    The field is set only when the lookup finds a value.
+
+    With an application name mapping, the application ID of the file is resolved to its
+    name once per plan, so the name is added to the events like any other default field.
+    """
+
+    CACHE_SIZE = 1024
+
+    def __init__(self, static_fields=None, lookup_fields=None, application_names=None,
+                 application_name_field='applicationName'):
+        """
+        Args:
+            static_fields (dict): Fields added to every event that does not have them.
+            lookup_fields (dict): Target field -> {"source": field, "values": {value: result}}.
+            application_names (MappingFile): Mapping of application IDs to names.
+            application_name_field (str): Field the resolved application name is added as.
+
+        Raises:
+            ValueError: If a lookup field is malformed.
+        """
+        self.static_fields = dict(static_fields or {})
+        self.application_names = application_names
+        self.application_name_field = application_name_field
+        self.lookups = []
+        for target, lookup in (lookup_fields or {}).items():
+            if "source" not in lookup or not isinstance(lookup.get("values"), dict):
+                raise ValueError(f"Lookup field '{target}' needs a 'source' field and a 'values' table")
+            values = {str(value): result for value, result in lookup["values"].items()}
+            self.lookups.append((target, lookup["source"], values))
+        self._plans = {}
+
+    def file_fields(self, log_type, tenant_name, application_name, resolved_name=None):
+        """
+        Return the fields a file contributes as (overwrite fields, default fields).
+        """
+        overwrite = {'logType': log_type}
+        defaults = {}
+        if log_type == 'WebDDoS':
+            defaults['applicationName'] = application_name
+        if log_type != "Access":
+            defaults['tenantName'] = tenant_name
+        if resolved_name is not None:
+            defaults.setdefault(self.application_name_field, resolved_name)
+        for name, value in self.static_fields.items():
+            defaults.setdefault(name, value)
+        return overwrite, defaults
+
+    def plan(self, log_type, tenant_name, application_name, application_id=None):
+        """
+        Return the compiled enrichment function for the events of a file.
+
+        Args:
+            log_type (str): The type of the log.
+            tenant_name (str): Name of the tenant.
+            application_name (str): Name of the application.
+            application_id (str): Application ID, resolved through the application name mapping.
+
+        Returns:
+            callable: enrich(events) -> generator of the events, enriched in place.
+        """
+        resolved_name = None
+        if self.application_names is not None and application_id:
+            resolved_name = self.application_names.get(application_id)
+        # The resolved name is part of the key, so a refreshed mapping compiles new plans
+        cache_key = (log_type, tenant_name, application_name, resolved_name)
+        plan = self._plans.get(cache_key)
+        if plan is None:
+            if len(self._plans) >= self.CACHE_SIZE:
+                self._plans.clear()
+            plan = self._plans[cache_key] = self._compile(*self.file_fields(*cache_key))
+        return plan
+
+    def _compile(self, overwrite, defaults):
+        default_items = tuple(defaults.items())
+        lookups = tuple(self.lookups)
+
+        # Specialized variants for the common plans keep the per-event path free of loops.
+        # Plans consume the whole stream, which saves a function call per event.
+        if not lookups and len(overwrite) == 1 and len(default_items) <= 2:
+            (field, value), = overwrite.items()
+            if not default_items:
+                def enrich(events):
+                    for event in events:
+                        event[field] = value
+                        yield event
+            elif len(default_items) == 1:
+                (default_field, default_value), = default_items
+
+                def enrich(events):
+                    for event in events:
+                        event[field] = value
+                        if default_field not in event:
+                            event[default_field] = default_value
+                        yield event
+            else:
+                (first_field, first_value), (second_field, second_value) = default_items
+
+                def enrich(events):
+                    for event in events:
+                        event[field] = value
+                        if first_field not in event:
+                            event[first_field] = first_value
+                        if second_field not in event:
+                            event[second_field] = second_value
+                        yield event
+            return enrich
+
+        def enrich(events):
+            for event in events:
+                event.update(overwrite)
+                for name, default_value in default_items:
+                    if name not in event:
+                        event[name] = default_value
+                for target, source, values in lookups:
+                    result = values.get(str(event.get(source)))
+                    if result is not None:
+                        event[target] = result
+                yield event
+        return enrich
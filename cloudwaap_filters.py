@@ -0,0 +1,461 @@
+import operator
+import os
+import re
+
+from cloudwaap_log_utils import CloudWAAPProcessor
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<op>==|!=|<=|>=|!~|<|>|~)
+      | (?P<punct>[()\[\],])
+      | (?P<name>[A-Za-z_][\w.-]*)
+    )""", re.VERBOSE)
+
+_KEYWORDS = {"and", "or", "not", "in"}
+_CONSTANTS = {"true": True, "false": False, "null": None}
+_NUMBER_OPERATORS = {"==": operator.eq, "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+def _field_getter(path):
+    names = path.split('.')
+    if len(names) == 1:
+        return lambda event: event.get(path)
+
+    def get(event):
+        value = event
+        for name in names:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(name)
+        return value
+    return get
+
+
+def _as_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _comparison(get, op, literal):
+    """
+    Compile a single comparison into a predicate. Values are compared as strings, or as
+    numbers when the literal is a number, so "200" and 200 in the logs compare equal.
+    """
+    if op in ("in", "not in"):
+        allowed = frozenset(str(item) for item in literal)
+        if op == "in":
+            return lambda event: str(get(event)) in allowed
+        return lambda event: str(get(event)) not in allowed
+    if op in ("~", "!~"):
+        pattern = re.compile(literal)
+        if op == "~":
+            return lambda event: get(event) is not None and pattern.search(str(get(event))) is not None
+        return lambda event: get(event) is None or pattern.search(str(get(event))) is None
+    if literal is None:
+        if op == "==":
+            return lambda event: get(event) is None
+        if op == "!=":
+            return lambda event: get(event) is not None
+        raise ValueError(f"Operator '{op}' cannot be used with null")
+    if isinstance(literal, bool):
+        expected = str(literal).lower()
+        if op not in ("==", "!="):
+            raise ValueError(f"Operator '{op}' cannot be used with booleans")
+        if op == "==":
+            return lambda event: str(get(event)).lower() == expected
+        return lambda event: str(get(event)).lower() != expected
+    if isinstance(literal, (int, float)):
+        number = float(literal)
+        if op == "!=":
+            return lambda event: _as_number(get(event)) != number
+        compare = _NUMBER_OPERATORS[op]
+
+        def predicate(event):
+            value = _as_number(get(event))
+            return value is not None and compare(value, number)
+        return predicate
+    if op == "==":
+        return lambda event: str(get(event)) == literal
+    if op == "!=":
+        return lambda event: str(get(event)) != literal
+    raise ValueError(f"Operator '{op}' requires a number")
+
+
+class _Parser:
+    """
+    Recursive descent parser turning a filter expression into nested closures.
+
+        expression := and_expr ("or" and_expr)*
+        and_expr   := unary ("and" unary)*
+        unary      := "not" unary | "(" expression ")" | comparison
+        comparison := field op literal | field ["not"] "in" "[" literal ("," literal)* "]"
+    """
+
+    def __init__(self, expression, fields=None):
+        self.expression = expression
+        self.fields = fields
+        self.tokens = self._tokenize(expression)
+        self.position = 0
+
+    def _tokenize(self, expression):
+        tokens = []
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = _TOKEN_PATTERN.match(expression, position)
+            if match is None:
+                # The position reported is that of the offending character, after any whitespace
+                position += len(expression[position:]) - len(expression[position:].lstrip())
+                raise ValueError(f"Invalid filter expression '{self.expression}' at position {position}")
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind == "name" and text in _KEYWORDS:
+                kind = text
+            tokens.append((kind, text))
+            position = match.end()
+        return tokens
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _take(self, *kinds):
+        kind, text = self._peek()
+        if kind not in kinds and text not in kinds:
+            expected = " or ".join(kinds)
+            found = f"'{text}'" if text is not None else "end of expression"
+            raise ValueError(f"Invalid filter expression '{self.expression}': expected {expected}, found {found}")
+        self.position += 1
+        return kind, text
+
+    def parse(self):
+        predicate = self._expression()
+        if self.position != len(self.tokens):
+            raise ValueError(f"Invalid filter expression '{self.expression}': unexpected '{self._peek()[1]}'")
+        return predicate
+
+    def _expression(self):
+        terms = [self._and_expression()]
+        while self._peek()[0] == "or":
+            self.position += 1
+            terms.append(self._and_expression())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda event: any(term(event) for term in terms)
+
+    def _and_expression(self):
+        terms = [self._unary()]
+        while self._peek()[0] == "and":
+            self.position += 1
+            terms.append(self._unary())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda event: all(term(event) for term in terms)
+
+    def _unary(self):
+        kind, _ = self._peek()
+        if kind == "not":
+            self.position += 1
+            term = self._unary()
+            return lambda event: not term(event)
+        if kind == "punct" and self._peek()[1] == "(":
+            self.position += 1
+            term = self._expression()
+            self._take(")")
+            return term
+        return self._comparison()
+
+    def _literal(self):
+        kind, text = self._take("string", "number", "name")
+        if kind == "name":
+            if text not in _CONSTANTS:
+                raise ValueError(f"Invalid filter expression '{self.expression}': unknown value '{text}'")
+            return _CONSTANTS[text]
+        if kind == "number":
+            return float(text) if '.' in text else int(text)
+        # Backslashes are kept as written, so regular expressions need no extra escaping
+        quote = text[0]
+        return text[1:-1].replace('\\' + quote, quote)
+
+    def _comparison(self):
+        _, field = self._take("name")
+        if self.fields is not None and field not in self.fields:
+            raise ValueError(f"Invalid filter expression '{self.expression}': unknown field '{field}', "
+                             f"expected one of {', '.join(sorted(self.fields))}")
+        get = _field_getter(field)
+        kind, text = self._peek()
+        if kind in ("in", "not"):
+            self.position += 1
+            op = "in"
+            if kind == "not":
+                self._take("in")
+                op = "not in"
+            self._take("[")
+            values = [self._literal()]
+            while self._peek()[1] == ",":
+                self.position += 1
+                values.append(self._literal())
+            self._take("]")
+            return _comparison(get, op, values)
+        _, op = self._take("op")
+        literal = self._literal()
+        if op in ("~", "!~") and not isinstance(literal, str):
+            raise ValueError(f"Invalid filter expression '{self.expression}': '{op}' requires a string pattern")
+        try:
+            return _comparison(get, op, literal)
+        except ValueError as e:
+            raise ValueError(f"Invalid filter expression '{self.expression}': {e}")
+
+
+def compile_filter_expression(expression, fields=None):
+    """
+    Compile a filter expression into a predicate.
+
+    Expressions compare event fields (dotted names reach into nested objects) with literal
+    strings, numbers, true, false and null, e.g.:
+
+        action == 'Allowed' and uri ~ '\\.(css|js|png|ico)$'
+        status >= 400 or request.method not in ['GET', 'HEAD']
+
+    Operators are ==, !=, <, <=, >, >=, ~ and !~ (regular expression search), in and not in.
+    Terms combine with and, or, not and parentheses. Backslashes in strings are kept as
+    written, except before the enclosing quote.
+
+    Args:
+        expression (str): The filter expression.
+        fields (set): Field names the expression may use, any if None.
+
+    Returns:
+        callable: predicate(event) -> bool.
+
+    Raises:
+        ValueError: If the expression is invalid or uses a field that is not allowed.
+    """
+    try:
+        return _Parser(expression, fields).parse()
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression in filter expression '{expression}': {e}")
+
+
+def _json_size(value):
+    # Approximate size of the value serialized as JSON, without serializing it
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return sum(len(key) + 4 + _json_size(item) for key, item in value.items()) + 2
+    if isinstance(value, list):
+        return sum(_json_size(item) + 2 for item in value) + 2
+    return len(str(value))
+
+
+class EventFilter:
+    """
+    EventFilter drops unwanted events and fields before they are written, to reduce the
+    volume shipped downstream.
+
+    Filters are expressions per log type (see compile_filter_expression); an event matching
+    any of them is dropped. Projections keep or drop top-level fields per log type:
+
+        {"Access": {"keep": ["time", "action", "uri", "sourceIp"]}, "WAF": {"drop": ["headers"]}}
+
+    The key "*" applies to all log types without an entry of their own. Everything is
+    compiled once per log type into a single function applied to the event stream. Dropped
+    events and the approximate number of bytes saved are counted until take_stats().
+    """
+
+    def __init__(self, projections=None, filters=None):
+        """
+        Args:
+            projections (dict): Log type -> {"keep": [fields]} or {"drop": [fields]}.
+            filters (dict): Log type -> list of filter expressions.
+
+        Raises:
+            ValueError: If a projection or filter expression is invalid.
+        """
+        self._projections = {log_type: self._compile_projection(log_type, projection)
+                             for log_type, projection in (projections or {}).items()}
+        self._filters = {log_type: self._compile_filters(expressions)
+                         for log_type, expressions in (filters or {}).items()}
+        self._plans = {}
+        self.dropped_events = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def _compile_projection(log_type, projection):
+        if set(projection) - {"keep", "drop"} or len(projection) != 1:
+            raise ValueError(f"Projection for log type '{log_type}' needs exactly one of 'keep' or 'drop'")
+        mode, fields = next(iter(projection.items()))
+        return mode, frozenset(fields)
+
+    @staticmethod
+    def _compile_filters(expressions, fields=None):
+        if isinstance(expressions, str):
+            expressions = [expressions]
+        predicates = [compile_filter_expression(expression, fields) for expression in expressions]
+        if not predicates:
+            return None
+        if len(predicates) == 1:
+            return predicates[0]
+        return lambda event: any(predicate(event) for predicate in predicates)
+
+    def applies_to(self, log_type):
+        """
+        Return True if events of the log type are filtered or projected.
+        """
+        return self.plan(log_type) is not None
+
+    def plan(self, log_type):
+        """
+        Return the compiled function for a log type, or None if its events pass unchanged.
+
+        The function takes an event and returns the event to write, or None to drop it.
+        """
+        try:
+            return self._plans[log_type]
+        except KeyError:
+            pass
+        projection = self._projections.get(log_type, self._projections.get("*"))
+        drop_event = self._filters.get(log_type, self._filters.get("*"))
+        self._plans[log_type] = plan = self._compile_plan(projection, drop_event)
+        return plan
+
+    def _compile_plan(self, projection, drop_event):
+        if projection is None and drop_event is None:
+            return None
+
+        def dropped(event):
+            self.dropped_events += 1
+            self.bytes_saved += _json_size(event)
+            return None
+
+        if projection is None:
+            return lambda event: dropped(event) if drop_event(event) else event
+
+        mode, fields = projection
+        if mode == "keep":
+            def project(event):
+                removed = [name for name in event if name not in fields]
+                for name in removed:
+                    self.bytes_saved += len(name) + 4 + _json_size(event.pop(name))
+                return event
+        else:
+            def project(event):
+                for name in fields.intersection(event):
+                    self.bytes_saved += len(name) + 4 + _json_size(event.pop(name))
+                return event
+
+        if drop_event is None:
+            return project
+        return lambda event: dropped(event) if drop_event(event) else project(event)
+
+    def apply(self, events, log_type):
+        """
+        Filter and project a stream of events of one log type.
+
+        Args:
+            events (iterable): Event dictionaries.
+            log_type (str): Log type of the events.
+
+        Returns:
+            iterable: The remaining events, projected.
+        """
+        plan = self.plan(log_type)
+        if plan is None:
+            return events
+        return (event for event in map(plan, events) if event is not None)
+
+    def take_stats(self):
+        """
+        Return the counters since the last call as (dropped events, bytes saved) and reset them.
+        """
+        stats = (self.dropped_events, self.bytes_saved)
+        self.dropped_events = 0
+        self.bytes_saved = 0
+        return stats
+
+
+class _KeyAttributes:
+    """
+    Attributes of an object key for key filter expressions, parsed on first use.
+    """
+
+    __slots__ = ('key', '_values')
+
+    def __init__(self, key):
+        self.key = key
+        self._values = {'key': key}
+
+    def get(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        value = self._values[name] = KeyFilter.ATTRIBUTES[name](self.key)
+        return value
+
+
+def _key_application(key):
+    # Same value as the "application" attribute of routing rules, so filtering and routing agree
+    return CloudWAAPProcessor.parse_application_name(key) or ''
+
+
+def _key_extension(key):
+    name = key.rsplit('/', 1)[-1]
+    if name.endswith('.json.gz'):
+        return '.json.gz'
+    return os.path.splitext(name)[1]
+
+
+class KeyFilter:
+    """
+    KeyFilter decides from the object key alone whether a log file is processed, so files
+    nobody needs are skipped without being downloaded.
+
+    Expressions (see compile_filter_expression) are evaluated over the attributes of the
+    key: logType, tenant, application, extension (".json.gz", ".txt", ...) and the key
+    itself. A file is processed when it matches one of the allow expressions, if there are
+    any, and none of the deny expressions. Only the attributes an expression uses are
+    parsed. Skipped files are counted until take_stats().
+    """
+
+    ATTRIBUTES = {
+        "logType": CloudWAAPProcessor.identify_log_type,
+        "tenant": CloudWAAPProcessor.parse_tenant_name,
+        "application": _key_application,
+        "extension": _key_extension,
+    }
+
+    def __init__(self, allow=None, deny=None):
+        """
+        Args:
+            allow (list): Filter expressions, one of which a key must match (empty allows all keys).
+            deny (list): Filter expressions no key may match.
+
+        Raises:
+            ValueError: If an expression is invalid or uses an unknown attribute.
+        """
+        fields = set(self.ATTRIBUTES) | {"key"}
+        self._allow = EventFilter._compile_filters(allow or [], fields)
+        self._deny = EventFilter._compile_filters(deny or [], fields)
+        self.skipped = 0
+
+    def allows(self, key):
+        """
+        Return True if the file with the key is to be processed; skipped keys are counted.
+        """
+        attributes = _KeyAttributes(key)
+        if (self._allow is not None and not self._allow(attributes)) or (
+                self._deny is not None and self._deny(attributes)):
+            self.skipped += 1
+            return False
+        return True
+
+    def take_stats(self):
+        """
+        Return the number of skipped files since the last call and reset it.
+        """
+        skipped, self.skipped = self.skipped, 0
+        return skipped
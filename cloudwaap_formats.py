@@ -0,0 +1,209 @@
+DEVICE_VENDOR = "Radware"
+DEVICE_PRODUCT = "Cloud WAAP"
+DEVICE_VERSION = "2.1.1"
+
+# Escaping as required by the CEF and LEEF specifications, applied with str.translate
+CEF_HEADER_ESCAPES = str.maketrans({'\\': '\\\\', '|': '\\|', '\n': ' ', '\r': ' '})
+CEF_VALUE_ESCAPES = str.maketrans({'\\': '\\\\', '=': '\\=', '\n': '\\n', '\r': '\\r'})
+LEEF_HEADER_ESCAPES = str.maketrans({'\\': '\\\\', '|': '\\|', '\n': ' ', '\r': ' ', '\t': ' '})
+LEEF_VALUE_ESCAPES = str.maketrans({'\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+SEVERITY_LEVELS = {"info": 1, "informational": 1, "low": 3, "warning": 4, "medium": 5, "high": 8,
+                   "very-high": 9, "critical": 10}
+
+# Output keys mapped to the Cloud WAAP fields they are taken from (the first present one),
+# or to {"value": constant}. The header keys fall back to the log type.
+CEF_DEFAULT_FIELDS = {
+    "signatureId": ["ruleId", "signatureId", "violationType"],
+    "name": ["violationType", "name", "action"],
+    "severity": ["severity"],
+    "rt": ["receivedTimeStamp", "time", "timestamp"],
+    "src": ["sourceIp", "source_ip", "clientIp"],
+    "spt": ["sourcePort", "source_port"],
+    "dst": ["destinationIp", "destination_ip"],
+    "dpt": ["destinationPort", "destination_port"],
+    "dhost": ["host", "hostname"],
+    "request": ["uri", "url", "request"],
+    "requestMethod": ["method", "http_method"],
+    "requestClientApplication": ["userAgent", "user_agent"],
+    "act": ["action"],
+    "cs1Label": {"value": "tenant"},
+    "cs1": ["tenantName"],
+    "cs2Label": {"value": "application"},
+    "cs2": ["applicationName"],
+}
+CEF_HEADER_KEYS = ("signatureId", "name", "severity")
+
+LEEF_DEFAULT_FIELDS = {
+    "eventId": ["ruleId", "signatureId", "violationType"],
+    "devTime": ["receivedTimeStamp", "time", "timestamp"],
+    "src": ["sourceIp", "source_ip", "clientIp"],
+    "srcPort": ["sourcePort", "source_port"],
+    "dst": ["destinationIp", "destination_ip"],
+    "dstPort": ["destinationPort", "destination_port"],
+    "sev": ["severity"],
+    "url": ["uri", "url", "request"],
+    "method": ["method", "http_method"],
+    "userAgent": ["userAgent", "user_agent"],
+    "action": ["action"],
+    "tenant": ["tenantName"],
+    "application": ["applicationName"],
+}
+LEEF_HEADER_KEYS = ("eventId",)
+
+
+def _getter(source):
+    """
+    Compile a field map entry into a function returning the value for an event, or None.
+    """
+    if isinstance(source, dict):
+        value = source.get("value")
+        return lambda event: value
+    fields = (source,) if isinstance(source, str) else tuple(source)
+    if len(fields) == 1:
+        field, = fields
+        return lambda event: event.get(field)
+
+    def get(event):
+        for field in fields:
+            value = event.get(field)
+            if value is not None and value != "":
+                return value
+        return None
+    return get
+
+
+def _compile_attributes(fields, header_keys, value_escapes, separator):
+    """
+    Compile the non-header keys of a field map into (rendered prefix, getter) pairs.
+
+    Constant values are rendered once. A CEF label key ("cs1Label") is rendered into the
+    prefix of the key it labels ("cs1"), so a label is only written together with a value.
+    """
+    attributes = []
+    labels = {}
+    for key, source in fields.items():
+        if key in header_keys:
+            continue
+        labelled = key[:-len("Label")] if key.endswith("Label") else None
+        if labelled in fields and isinstance(source, dict):
+            labels[labelled] = f"{key}={str(source.get('value')).translate(value_escapes)}{separator}"
+            continue
+        attributes.append((key, source))
+    compiled = []
+    for key, source in attributes:
+        prefix = labels.get(key, "") + f"{key}="
+        if isinstance(source, dict):
+            value = source.get("value")
+            if value is not None and value != "":
+                compiled.append((prefix + str(value).translate(value_escapes), None))
+            continue
+        compiled.append((prefix, _getter(source)))
+    return tuple(compiled)
+
+
+def _join_attributes(attributes, event, value_escapes, separator):
+    parts = []
+    for prefix, get in attributes:
+        if get is None:
+            parts.append(prefix)
+            continue
+        value = get(event)
+        if value is not None and value != "":
+            parts.append(prefix + str(value).translate(value_escapes))
+    return separator.join(parts)
+
+
+def _severity(value):
+    if value is None:
+        return "5"
+    text = str(value)
+    if text.isdigit():
+        return text
+    return str(SEVERITY_LEVELS.get(text.lower(), 5))
+
+
+class SiemFormatter:
+    """
+    SiemFormatter renders log events as CEF or LEEF lines for SIEMs.
+
+    Output keys are mapped to Cloud WAAP fields per log type: the defaults above, updated
+    by the configured field maps ("*" for all log types, then the log type's own map; a key
+    mapped to None is removed). The map of a log type is compiled once into a template:
+    a constant header prefix, header getters and a list of (rendered key prefix, getter)
+    pairs, so formatting an event only reads its fields and escapes their values.
+    """
+
+    FORMATS = ("cef", "leef")
+
+    def __init__(self, output_format, field_maps=None):
+        """
+        Args:
+            output_format (str): "cef" or "leef".
+            field_maps (dict): Log type -> {output key: field, [fields], {"value": constant} or None}.
+
+        Raises:
+            ValueError: If the format is not supported.
+        """
+        if output_format not in self.FORMATS:
+            raise ValueError(f"Unsupported SIEM output format '{output_format}'")
+        self.output_format = output_format
+        self.field_maps = field_maps or {}
+        self._templates = {}
+
+    def field_map(self, log_type):
+        """
+        Return the effective field map of a log type.
+        """
+        fields = dict(CEF_DEFAULT_FIELDS if self.output_format == "cef" else LEEF_DEFAULT_FIELDS)
+        for overrides in (self.field_maps.get("*", {}), self.field_maps.get(log_type, {})):
+            for key, source in overrides.items():
+                if source is None:
+                    fields.pop(key, None)
+                else:
+                    fields[key] = source
+        return fields
+
+    def template(self, log_type):
+        """
+        Return the compiled function formatting an event of the log type as one line.
+        """
+        template = self._templates.get(log_type)
+        if template is None:
+            compile_template = self._compile_cef if self.output_format == "cef" else self._compile_leef
+            template = self._templates[log_type] = compile_template(log_type, self.field_map(log_type))
+        return template
+
+    @staticmethod
+    def _compile_cef(log_type, fields):
+        prefix = "CEF:0|{}|{}|{}|".format(*(text.translate(CEF_HEADER_ESCAPES)
+                                            for text in (DEVICE_VENDOR, DEVICE_PRODUCT, DEVICE_VERSION)))
+        fallback = log_type.translate(CEF_HEADER_ESCAPES)
+        get_signature, get_name, get_severity = (_getter(fields[key]) if key in fields else (lambda event: None)
+                                                 for key in CEF_HEADER_KEYS)
+        extensions = _compile_attributes(fields, CEF_HEADER_KEYS, CEF_VALUE_ESCAPES, ' ')
+
+        def format_cef(event):
+            signature = get_signature(event)
+            name = get_name(event)
+            header = (f"{prefix}{fallback if signature is None else str(signature).translate(CEF_HEADER_ESCAPES)}"
+                      f"|{fallback if name is None else str(name).translate(CEF_HEADER_ESCAPES)}"
+                      f"|{_severity(get_severity(event))}|")
+            return header + _join_attributes(extensions, event, CEF_VALUE_ESCAPES, ' ')
+        return format_cef
+
+    @staticmethod
+    def _compile_leef(log_type, fields):
+        prefix = "LEEF:1.0|{}|{}|{}|".format(*(text.translate(LEEF_HEADER_ESCAPES)
+                                               for text in (DEVICE_VENDOR, DEVICE_PRODUCT, DEVICE_VERSION)))
+        fallback = log_type.translate(LEEF_HEADER_ESCAPES)
+        get_event_id = _getter(fields["eventId"]) if "eventId" in fields else (lambda event: None)
+        # The event category defaults to the log type and comes first
+        fields = dict({"cat": {"value": log_type}}, **fields)
+        attributes = _compile_attributes(fields, LEEF_HEADER_KEYS, LEEF_VALUE_ESCAPES, '\t')
+
+        def format_leef(event):
+            event_id = get_event_id(event)
+            header = f"{prefix}{fallback if event_id is None else str(event_id).translate(LEEF_HEADER_ESCAPES)}|"
+            return header + _join_attributes(attributes, event, LEEF_VALUE_ESCAPES, '\t')
+        return format_leef
@@ -0,0 +1,235 @@
+import fcntl
+import json
+import os
+import time
+from collections import OrderedDict
+
+PROCESSING = "processing"
+DELIVERED = "delivered"
+
+
+class FileLedgerBackend:
+    """
+    FileLedgerBackend keeps ledger records in a local JSON file, locked for every update.
+
+    It is meant for tests and single-container setups: the file lives in the container's
+    /tmp (or a mounted file system) and is not shared between containers otherwise.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the ledger file.
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _update(self, change):
+        # The whole file is read, changed and replaced under an exclusive lock
+        with open(f"{self.path}.lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.path, 'r') as f:
+                    records = json.load(f)
+            except (OSError, ValueError):
+                records = {}
+            now = time.time()
+            records = {item_id: record for item_id, record in records.items() if record['expires'] >= now}
+            result = change(records, now)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(records, f, separators=(',', ':'))
+            os.replace(temp_path, self.path)
+            return result
+
+    def put_if_absent(self, item_id, record):
+        """
+        Store a record unless an unexpired record exists for the item.
+
+        Returns:
+            dict or None: The existing record, or None if the record was stored.
+        """
+        def change(records, now):
+            existing = records.get(item_id)
+            if existing is not None:
+                return existing
+            records[item_id] = record
+            return None
+        return self._update(change)
+
+    def put(self, item_id, record):
+        """
+        Store a record, replacing any existing one.
+        """
+        self._update(lambda records, now: records.__setitem__(item_id, record))
+
+    def delete(self, item_id):
+        """
+        Remove the record of an item.
+        """
+        self._update(lambda records, now: records.pop(item_id, None))
+
+
+class DynamoDBLedgerBackend:
+    """
+    DynamoDBLedgerBackend keeps ledger records in a DynamoDB table (or a compatible store),
+    shared by all containers.
+
+    The table needs a string partition key "id". Claims are conditional puts that only
+    succeed when no record exists or the existing one has expired, so exactly one
+    invocation wins. The "expires" attribute can be enabled as the table's TTL attribute
+    to remove old records.
+    """
+
+    def __init__(self, table, client=None):
+        """
+        Args:
+            table (str): Name of the table.
+            client: DynamoDB client; by default a boto3 client, created on first use.
+        """
+        self.table = table
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('dynamodb')
+        return self._client
+
+    @staticmethod
+    def _item(item_id, record):
+        return {'id': {'S': item_id}, 'state': {'S': record['state']}, 'expires': {'N': str(int(record['expires']))}}
+
+    def put_if_absent(self, item_id, record):
+        """
+        Store a record unless an unexpired record exists for the item.
+
+        Returns:
+            dict or None: The existing record, or None if the record was stored.
+        """
+        try:
+            self.client.put_item(
+                TableName=self.table,
+                Item=self._item(item_id, record),
+                ConditionExpression='attribute_not_exists(#id) OR #expires < :now',
+                ExpressionAttributeNames={'#id': 'id', '#expires': 'expires'},
+                ExpressionAttributeValues={':now': {'N': str(int(time.time()))}},
+            )
+            return None
+        except Exception as e:
+            error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if error_code != 'ConditionalCheckFailedException':
+                raise
+        item = self.client.get_item(TableName=self.table, Key={'id': {'S': item_id}},
+                                    ConsistentRead=True).get('Item')
+        if item is None:
+            # The record expired and was removed in between; the caller may retry
+            return {'state': PROCESSING, 'expires': 0}
+        return {'state': item['state']['S'], 'expires': float(item['expires']['N'])}
+
+    def put(self, item_id, record):
+        """
+        Store a record, replacing any existing one.
+        """
+        self.client.put_item(TableName=self.table, Item=self._item(item_id, record))
+
+    def delete(self, item_id):
+        """
+        Remove the record of an item.
+        """
+        self.client.delete_item(TableName=self.table, Key={'id': {'S': item_id}})
+
+
+class IdempotencyLedger:
+    """
+    IdempotencyLedger records which versions of which objects were already delivered, so
+    that the duplicate notifications S3 sends now and then do not deliver a file twice.
+
+    Objects are identified by bucket, key and version (ETag, or the event sequencer).
+    Before processing, an object is claimed with a conditional put of a "processing"
+    record that expires after `lease_seconds`, so a crashed invocation does not block the
+    object forever. After delivery the record becomes "delivered" for `retention_seconds`;
+    after a failure it is removed, so a retry can claim it again. Delivered objects are
+    also kept in an in-process LRU cache, which answers repeated duplicates without a
+    request to the backend.
+    """
+
+    def __init__(self, backend, cache_size=10000, lease_seconds=900, retention_seconds=7 * 24 * 3600):
+        """
+        Args:
+            backend: FileLedgerBackend, DynamoDBLedgerBackend or an object with the same methods.
+            cache_size (int): Number of delivered objects kept in the in-process cache.
+            lease_seconds (int): Time after which an unfinished claim expires.
+            retention_seconds (int): Time a delivered object is remembered.
+        """
+        self.backend = backend
+        self.cache_size = max(0, int(cache_size))
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def from_location(location, **options):
+        """
+        Create a ledger from a location: "dynamodb://table" or a local file path.
+        """
+        if location.startswith("dynamodb://"):
+            return IdempotencyLedger(DynamoDBLedgerBackend(location[len("dynamodb://"):]), **options)
+        return IdempotencyLedger(FileLedgerBackend(location), **options)
+
+    @staticmethod
+    def item_id(bucket, key, version):
+        """
+        Return the ledger identifier of an object version.
+        """
+        # ETags are quoted in listings and responses, but not in event records
+        return "{}/{}@{}".format(bucket, key, version.strip('"'))
+
+    def begin(self, bucket, key, version):
+        """
+        Claim an object version for processing.
+
+        Returns:
+            str or None: None if the claim succeeded, otherwise the state of the earlier
+                claim: "processing" or "delivered".
+        """
+        item_id = self.item_id(bucket, key, version)
+        expires = self._cache.get(item_id)
+        if expires is not None:
+            if expires >= time.time():
+                self._cache.move_to_end(item_id)
+                return DELIVERED
+            del self._cache[item_id]
+        existing = self.backend.put_if_absent(
+            item_id, {'state': PROCESSING, 'expires': time.time() + self.lease_seconds})
+        if existing is None:
+            return None
+        if existing['state'] == DELIVERED:
+            self._remember(item_id, existing['expires'])
+        return existing['state']
+
+    def complete(self, bucket, key, version):
+        """
+        Record a claimed object version as delivered.
+        """
+        item_id = self.item_id(bucket, key, version)
+        expires = time.time() + self.retention_seconds
+        self.backend.put(item_id, {'state': DELIVERED, 'expires': expires})
+        self._remember(item_id, expires)
+
+    def abandon(self, bucket, key, version):
+        """
+        Release the claim of an object version that was not delivered, so it can be retried.
+        """
+        self.backend.delete(self.item_id(bucket, key, version))
+
+    def _remember(self, item_id, expires):
+        if not self.cache_size:
+            return
+        self._cache[item_id] = expires
+        self._cache.move_to_end(item_id)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,351 @@
+import bisect
+import csv
+import ipaddress
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = b'CWIPR1\0\0'
+# Magic, IPv4 range count, IPv6 range count, metadata size and padding to keep the columns 8-byte aligned
+_HEADER = struct.Struct('<8sIIII')
+
+
+def _ip_to_int(value):
+    """
+    Convert an IP address string (or integer) to (version, integer), or None if invalid.
+    """
+    try:
+        address = ipaddress.ip_address(int(value) if isinstance(value, int) or value.isdigit() else value.strip())
+    except (AttributeError, ValueError):
+        return None
+    return address.version, int(address)
+
+
+class _WideColumn:
+    """
+    Read-only sequence of 128-bit integers stored as (high, low) pairs of 64-bit words,
+    so bisect can search IPv6 range starts held in a flat array or a memory map.
+    """
+
+    __slots__ = ('words',)
+
+    def __init__(self, words):
+        self.words = words
+
+    def __len__(self):
+        return len(self.words) // 2
+
+    def __getitem__(self, index):
+        return (self.words[2 * index] << 64) | self.words[2 * index + 1]
+
+
+class IPRangeTable:
+    """
+    IPRangeTable maps IP addresses to the attributes of the range containing them, such as
+    the country or ASN of a GeoIP/ASN database.
+
+    IPv4 ranges are kept in sorted uint32 arrays (start, end and value index), IPv6 ranges
+    in arrays of 64-bit words; a lookup is a binary search over the range starts. Two
+    table formats are supported:
+
+        CSV     A header row "start,end,<field>,..." followed by one row per range, with
+                start and end as IP addresses or integers. Parsed into arrays on load.
+        Binary  The arrays written by write_binary() (see build_binary_table), memory
+                mapped on load, so the table is neither parsed nor copied and its pages are
+                shared by the page cache. Used for large tables shipped in a Lambda layer.
+                The arrays use the native (little-endian) byte order of the Lambda runtimes.
+
+    When NumPy is available, lookup_many() resolves IPv4 addresses with a single vectorized
+    searchsorted call.
+    """
+
+    def __init__(self, fields, v4_ranges, v6_ranges, values, mapped=None):
+        """
+        Args:
+            fields (list): Names of the range attributes.
+            v4_ranges (tuple): (starts, ends, value indexes) of the IPv4 ranges.
+            v6_ranges (tuple): (starts, ends, value indexes) of the IPv6 ranges, as 64-bit word pairs.
+            values (list): Attribute tuples referenced by the value indexes.
+            mapped (mmap.mmap): Memory map backing the arrays, kept open with the table.
+        """
+        self.fields = list(fields)
+        self.values = [tuple(value) for value in values]
+        self._v4_starts, self._v4_ends, self._v4_values = v4_ranges
+        self._v6_starts = _WideColumn(v6_ranges[0])
+        self._v6_ends = _WideColumn(v6_ranges[1])
+        self._v6_values = v6_ranges[2]
+        self._mapped = mapped
+        self._numpy_starts = None
+
+    def __len__(self):
+        return len(self._v4_values) + len(self._v6_values)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a table from a CSV file or memory map a binary table.
+
+        Raises:
+            ValueError: If the file is not a valid range table.
+        """
+        with open(path, 'rb') as f:
+            is_binary = f.read(len(MAGIC)) == MAGIC
+        if is_binary:
+            return cls._load_binary(path)
+        return cls._load_csv(path)
+
+    @classmethod
+    def _load_csv(cls, path):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header or len(header) < 3:
+                raise ValueError(f"IP range table {path} needs a header 'start,end,<field>,...'")
+            rows = {4: [], 6: []}
+            value_index = {}
+            for row in reader:
+                if len(row) < len(header):
+                    continue
+                start, end = _ip_to_int(row[0]), _ip_to_int(row[1])
+                if start is None or end is None or start[0] != end[0]:
+                    continue
+                value = tuple(row[2:len(header)])
+                index = value_index.setdefault(value, len(value_index))
+                rows[start[0]].append((start[1], end[1], index))
+
+        values = [None] * len(value_index)
+        for value, index in value_index.items():
+            values[index] = value
+        v4 = sorted(rows[4])
+        v6 = sorted(rows[6])
+        v4_ranges = (array('I', (row[0] for row in v4)), array('I', (row[1] for row in v4)),
+                     array('I', (row[2] for row in v4)))
+        v6_ranges = (array('Q', (word for row in v6 for word in divmod(row[0], 1 << 64))),
+                     array('Q', (word for row in v6 for word in divmod(row[1], 1 << 64))),
+                     array('I', (row[2] for row in v6)))
+        return cls(header[2:], v4_ranges, v6_ranges, values)
+
+    @classmethod
+    def _load_binary(cls, path):
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, v4_count, v6_count, meta_size, _ = _HEADER.unpack_from(mapped, 0)
+        view = memoryview(mapped)
+        offset = _HEADER.size
+
+        def column(code, count):
+            nonlocal offset
+            size = struct.calcsize(code) * count
+            data = view[offset:offset + size].cast(code)
+            offset += size
+            return data
+
+        # 64-bit columns come first so that every column stays aligned
+        v6_starts, v6_ends = column('Q', 2 * v6_count), column('Q', 2 * v6_count)
+        v4_starts, v4_ends = column('I', v4_count), column('I', v4_count)
+        v4_values, v6_values = column('I', v4_count), column('I', v6_count)
+        meta = json.loads(bytes(view[offset:offset + meta_size]).decode('utf-8'))
+        return cls(meta['fields'], (v4_starts, v4_ends, v4_values), (v6_starts, v6_ends, v6_values),
+                   meta['values'], mapped)
+
+    def write_binary(self, path):
+        """
+        Write the table in the memory-mappable binary format.
+        """
+        meta = json.dumps({'fields': self.fields, 'values': self.values}, separators=(',', ':')).encode('utf-8')
+        columns = [self._v6_starts.words, self._v6_ends.words, self._v4_starts, self._v4_ends,
+                   self._v4_values, self._v6_values]
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, len(self._v4_values), len(self._v6_values), len(meta), 0))
+            for data in columns:
+                f.write(bytes(data))
+            f.write(meta)
+
+    def lookup(self, ip):
+        """
+        Return the attribute tuple of the range containing an IP address string, or None.
+        """
+        parsed = _ip_to_int(ip)
+        if parsed is None:
+            return None
+        version, number = parsed
+        if version == 4:
+            starts, ends, values = self._v4_starts, self._v4_ends, self._v4_values
+        else:
+            starts, ends, values = self._v6_starts, self._v6_ends, self._v6_values
+        index = bisect.bisect_right(starts, number) - 1
+        if index >= 0 and number <= ends[index]:
+            return self.values[values[index]]
+        return None
+
+    def lookup_many(self, ips):
+        """
+        Look up several IP address strings at once.
+
+        Returns:
+            dict: IP address -> attribute tuple or None.
+        """
+        if numpy is None or len(ips) < 16:
+            return {ip: self.lookup(ip) for ip in ips}
+
+        results = {}
+        v4_ips, v4_numbers = [], []
+        for ip in ips:
+            parsed = _ip_to_int(ip)
+            if parsed is not None and parsed[0] == 4:
+                v4_ips.append(ip)
+                v4_numbers.append(parsed[1])
+            else:
+                results[ip] = self.lookup(ip) if parsed is not None else None
+        if v4_ips:
+            if self._numpy_starts is None:
+                self._numpy_starts = numpy.frombuffer(self._v4_starts, dtype=numpy.uint32)
+            numbers = numpy.array(v4_numbers, dtype=numpy.uint32)
+            indexes = numpy.searchsorted(self._numpy_starts, numbers, side='right') - 1
+            for ip, number, index in zip(v4_ips, v4_numbers, indexes.tolist()):
+                found = index >= 0 and number <= self._v4_ends[index]
+                results[ip] = self.values[self._v4_values[index]] if found else None
+        return results
+
+
+class IPRangeEnricher:
+    """
+    IPRangeEnricher adds the attributes of the source IP's range (e.g. country and ASN) to
+    log events.
+
+    Events are processed in batches: the distinct IPs of a batch that are not in the LRU
+    cache are resolved together, then the fields are set. Attacks typically repeat the same
+    client IPs thousands of times per file, so most events are served by the cache. The
+    table is loaded on first use and kept for the lifetime of the container.
+    """
+
+    BATCH_SIZE = 1024
+
+    def __init__(self, location, source_fields, target_fields=None, log_types=None, cache_size=65536,
+                 s3_client=None, state_dir='/tmp'):
+        """
+        Args:
+            location (str): Local path (e.g. in a Lambda layer) or "s3://bucket/key" URI of the table.
+            source_fields (list): Event fields holding the IP address, in order of preference.
+            target_fields (dict): Table field -> event field; all table fields under their own name if empty.
+            log_types (list): Log types to enrich, all if empty.
+            cache_size (int): Number of IP lookups kept in the LRU cache.
+            s3_client: S3 client, required for S3 locations.
+            state_dir (str): Directory S3 tables are downloaded to.
+        """
+        self.location = location
+        self.source_fields = list(source_fields)
+        self.target_fields = dict(target_fields or {})
+        self.log_types = set(log_types or ())
+        self.cache_size = max(1, int(cache_size))
+        self.s3_client = s3_client
+        self.state_dir = state_dir
+        self.table = None
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._assignments = None
+
+    def applies_to(self, log_type):
+        """
+        Return True if events of the log type are enriched.
+        """
+        return not self.log_types or log_type in self.log_types
+
+    def load(self):
+        """
+        Load the table, downloading it first if it is stored in S3.
+        """
+        path = self.location
+        if path.startswith("s3://"):
+            bucket, _, key = path[len("s3://"):].partition('/')
+            path = os.path.join(self.state_dir, 'ip-ranges-' + os.path.basename(key))
+            # Kept outside the per-invocation /tmp cleanup, so a container downloads it once
+            if not os.path.exists(path):
+                os.makedirs(self.state_dir, exist_ok=True)
+                self.s3_client.download_file(bucket, key, f"{path}.tmp")
+                os.replace(f"{path}.tmp", path)
+        self.table = IPRangeTable.load(path)
+        fields = self.table.fields
+        targets = self.target_fields or {field: field for field in fields}
+        unknown = [field for field in targets if field not in fields]
+        if unknown:
+            raise ValueError(f"IP range table {self.location} has no fields {unknown}")
+        # (event field, position in the attribute tuple) pairs, resolved once
+        self._assignments = tuple((target, fields.index(field)) for field, target in targets.items())
+        print(f"Loaded {len(self.table)} IP ranges from {self.location}.")
+
+    def _source_ip(self, event):
+        for field in self.source_fields:
+            value = event.get(field)
+            # Lists, objects and booleans are no addresses and cannot be cached by value
+            if value and isinstance(value, (str, int)) and not isinstance(value, bool):
+                return value
+        return None
+
+    def _resolve(self, ips):
+        cache = self._cache
+        misses = [ip for ip in ips if ip not in cache]
+        if misses:
+            for ip, attributes in self.table.lookup_many(misses).items():
+                cache[ip] = tuple((field, attributes[position]) for field, position in self._assignments) \
+                    if attributes is not None else ()
+        return len(misses)
+
+    def enrich(self, events):
+        """
+        Enrich a stream of events in place.
+
+        Returns:
+            generator: The events, with the range fields of their source IP added.
+        """
+        if self.table is None:
+            self.load()
+        cache = self._cache
+        batch = []
+        for event in events:
+            batch.append(event)
+            if len(batch) >= self.BATCH_SIZE:
+                yield from self._enrich_batch(batch, cache)
+                batch = []
+        if batch:
+            yield from self._enrich_batch(batch, cache)
+
+    def _enrich_batch(self, batch, cache):
+        ips = [self._source_ip(event) for event in batch]
+        misses = self._resolve({ip for ip in ips if ip is not None})
+        self.misses += misses
+        self.hits += len(ips) - ips.count(None) - misses
+        for event, ip in zip(batch, ips):
+            if ip is not None:
+                cache.move_to_end(ip)
+                for field, value in cache[ip]:
+                    event[field] = value
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return batch
+
+
+def build_binary_table(csv_path, binary_path):
+    """
+    Convert a CSV range table into the binary format, e.g. to ship it in a Lambda layer.
+    """
+    table = IPRangeTable.load(csv_path)
+    table.write_binary(binary_path)
+    print(f"Wrote {len(table)} IP ranges to {binary_path}.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python cloudwaap_iprange.py <ranges.csv> <ranges.bin>")
+        sys.exit(2)
+    build_binary_table(sys.argv[1], sys.argv[2])
@@ -1,6 +1,15 @@
+import json
 import re
 from urllib.parse import urlparse
-from datetime import datetime
+from datetime import datetime, timezone
+
+LOG_TIMESTAMP_PATTERN = re.compile(r"(\d{8}H\d{6})")
+JSON_DECODER = json.JSONDecoder()
+JSON_WHITESPACE = " \t\n\r"
+# Longest event decoded; invalid JSON is reported once this much text after it cannot be decoded
+MAX_EVENT_CHARS = 8 * 1024 * 1024
+EVENT_TIMESTAMP_FORMATS = ("%Y-%m-%dT%H:%M:%S.%f%z", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d %H:%M:%S",
+                           "%d/%b/%Y:%H:%M:%S %z", "%d-%m-%Y %H:%M:%S")
 
 
 class CloudWAAPProcessor:
@@ -113,4 +122,152 @@ class CloudWAAPProcessor:
                 return None
         except Exception as e:
             print(f"Error parsing application name from key '{key}': {e}")
-            return None
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def parse_log_timestamp(key):
+        """
+        Extract the timestamp embedded in a Cloud WAAP log file name (e.g. "20241010H101500").
+
+        Args:
+            key (str): The S3 key or file name of the log.
+
+        Returns:
+            datetime or None: The timestamp as a UTC datetime, or None if the key has none.
+        """
+        match = LOG_TIMESTAMP_PATTERN.search(key.split("/")[-1])
+        if not match:
+            return None
+        try:
+            return datetime.strptime(match.group(1), "%Y%m%dH%H%M%S").replace(tzinfo=timezone.utc)
+        except ValueError as e:
+            print(f"Error parsing timestamp from key '{key}': {e}")
+            return None
+
+    @staticmethod
+    def parse_event_timestamp(event, fields):
+        """
+        Extract the timestamp of a single log event from the first of `fields` that holds one.
+
+        Epoch values in seconds or milliseconds (numbers or numeric strings), ISO 8601 and
+        the access log "10/Oct/2024:10:15:00 +0000" notation are recognized. Timestamps
+        without a zone are taken as UTC.
+
+        Args:
+            event (dict): The log event.
+            fields (list): Candidate timestamp field names, in order of preference.
+
+        Returns:
+            datetime or None: The timestamp as a UTC datetime, or None if no field could be parsed.
+        """
+        for field in fields:
+            value = event.get(field)
+            if value is None or value == "":
+                continue
+            if isinstance(value, str) and value.isdigit():
+                value = int(value)
+            if isinstance(value, (int, float)):
+                # Values beyond year 33658 in seconds are epoch milliseconds
+                seconds = value / 1000 if value > 1e12 else value
+                try:
+                    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+                except (OverflowError, OSError, ValueError):
+                    continue
+            if isinstance(value, str):
+                text = value.replace("Z", "+00:00") if value.endswith("Z") else value
+                for timestamp_format in EVENT_TIMESTAMP_FORMATS:
+                    try:
+                        parsed = datetime.strptime(text, timestamp_format)
+                    except ValueError:
+                        continue
+                    if parsed.tzinfo is None:
+                        return parsed.replace(tzinfo=timezone.utc)
+                    return parsed.astimezone(timezone.utc)
+        return None
+
+    @staticmethod
+    def iter_events(stream, chunk_size=1024 * 1024, cursor=None, max_event_size=MAX_EVENT_CHARS):
+        """
+        Incrementally decode the events of a Cloud WAAP log without loading the whole file.
+
+        The file is expected to hold a JSON array of events; a stream of concatenated JSON
+        values (e.g. NDJSON) is accepted as well.
+
+        Args:
+            stream: Text stream of the decompressed log, e.g. from gzip.open(path, 'rt').
+            chunk_size (int): Number of characters read at a time.
+            cursor (dict): Optional position, updated before every event is yielded with the
+                "offset" of the text consumed and whether the events are in an "array". Passing
+                the cursor of an interrupted pass resumes after its last event; the text before
+                it is skipped without being decoded.
+            max_event_size (int): Number of characters an event may span. A value that cannot be
+                decoded within this many characters is reported as invalid, instead of reading
+                the rest of the file in search of its end.
+
+        Yields:
+            dict: One log event at a time.
+
+        Raises:
+            json.JSONDecodeError: If the content is not valid JSON.
+        """
+        # Characters of the stream before the start of the buffer
+        consumed = 0
+        in_array = None
+        if cursor and cursor.get('offset'):
+            remaining = cursor['offset']
+            while remaining:
+                skipped = stream.read(min(chunk_size, remaining))
+                if not skipped:
+                    raise json.JSONDecodeError("Resume offset beyond the end of the log", '', consumed)
+                consumed += len(skipped)
+                remaining -= len(skipped)
+            in_array = cursor.get('array')
+
+        buffer = stream.read(chunk_size)
+        eof = not buffer
+        position = 0
+
+        while True:
+            # Skip whitespace and separators, reading more data when the buffer runs out
+            while True:
+                while position < len(buffer) and buffer[position] in JSON_WHITESPACE:
+                    position += 1
+                if position < len(buffer) or eof:
+                    break
+                consumed += len(buffer)
+                buffer, position = stream.read(chunk_size), 0
+                eof = not buffer
+
+            if position >= len(buffer):
+                if in_array:
+                    raise json.JSONDecodeError("Unterminated array", buffer, position)
+                return
+            if in_array is None:
+                in_array = buffer[position] == '['
+                if in_array:
+                    position += 1
+                continue
+            if in_array and buffer[position] == ']':
+                return
+            if in_array and buffer[position] == ',':
+                position += 1
+                continue
+
+            try:
+                event, end = JSON_DECODER.raw_decode(buffer, position)
+                # A value ending exactly at the buffer boundary may be truncated (e.g. a number)
+                if end == len(buffer) and not eof:
+                    raise json.JSONDecodeError("Value at buffer boundary", buffer, end)
+            except json.JSONDecodeError:
+                if eof or len(buffer) - position >= max_event_size:
+                    raise
+                more = stream.read(chunk_size)
+                eof = not more
+                consumed += position
+                buffer, position = buffer[position:] + more, 0
+                continue
+            if cursor is not None:
+                cursor['offset'] = consumed + end
+                cursor['array'] = in_array
+            yield event
+            position = end
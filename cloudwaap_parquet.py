@@ -0,0 +1,227 @@
+import json
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:
+    pyarrow = None
+    pyarrow_parquet = None
+
+# Column holding the fields of an event that are not in the schema, or do not fit their
+# column type, as a JSON object, so no data is lost when events differ from the first batch
+EXTRA_COLUMN = "_extra"
+
+_MISMATCH = object()
+
+
+def _infer_type(values):
+    """
+    Return the Parquet type of a column from its values in the first batch.
+
+    Columns with only integers, floats or booleans get numeric types; everything else,
+    including nested objects and lists (stored as JSON text), is a string column.
+    """
+    kinds = {type(value) for value in values if value is not None}
+    if kinds == {bool}:
+        return pyarrow.bool_()
+    if kinds == {int}:
+        return pyarrow.int64()
+    if kinds and kinds <= {int, float}:
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def infer_schema(events):
+    """
+    Infer a schema from a batch of events: one column per top-level field, in the order
+    the fields are first seen, plus the extra column.
+    """
+    columns = {}
+    for event in events:
+        for name, value in event.items():
+            columns.setdefault(name, []).append(value)
+    columns.pop(EXTRA_COLUMN, None)
+    fields = [pyarrow.field(name, _infer_type(values)) for name, values in columns.items()]
+    fields.append(pyarrow.field(EXTRA_COLUMN, pyarrow.string()))
+    return pyarrow.schema(fields)
+
+
+def _to_string(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _to_int(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return _MISMATCH
+
+
+def _to_float(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return _MISMATCH
+
+
+def _to_bool(value):
+    return value if isinstance(value, bool) else _MISMATCH
+
+
+def _converter(data_type):
+    if pyarrow.types.is_boolean(data_type):
+        return _to_bool
+    if pyarrow.types.is_integer(data_type):
+        return _to_int
+    if pyarrow.types.is_floating(data_type):
+        return _to_float
+    return _to_string
+
+
+class ParquetEventWriter:
+    """
+    ParquetEventWriter writes log events into a local Parquet file, for data lakes queried
+    with Athena and similar engines.
+
+    Events are buffered column by column and written as a row group whenever
+    `row_group_size` events are buffered, so memory stays bounded by one row group. The
+    schema of a log type is inferred from the first batch written for it and then reused
+    for all files of that log type in the container, so the files of a table share one
+    schema. It has the same interface as EventWriter.
+    """
+
+    def __init__(self, path, log_type, schemas, compression='snappy', row_group_size=50000):
+        """
+        Args:
+            path (str): Local path of the output file.
+            log_type (str): Log type of the events, selecting the schema.
+            schemas (dict): Log type -> schema, shared by the writers of a destination.
+            compression (str): Parquet compression codec: "snappy", "zstd", "gzip" or "none".
+            row_group_size (int): Number of events per row group.
+
+        Raises:
+            ImportError: If pyarrow is not available.
+        """
+        if pyarrow is None:
+            raise ImportError("pyarrow module is not available. Add it as a Lambda layer to write Parquet output.")
+        self.path = path
+        self.log_type = log_type
+        self.compression = compression
+        self.row_group_size = max(1, int(row_group_size))
+        self.event_count = 0
+        self.row_groups = 0
+        self._schemas = schemas
+        self._file = open(path, 'wb')
+        self._parquet_writer = None
+        self._pending = []
+        self._columns = None
+        self._extra = None
+        self._set_schema(schemas.get(log_type))
+
+    @property
+    def size(self):
+        """
+        Approximate number of bytes written to the local file so far.
+        """
+        return self._file.tell()
+
+    def _set_schema(self, schema):
+        self.schema = schema
+        if schema is None:
+            return
+        self._conversions = tuple((field.name, _converter(field.type)) for field in schema
+                                  if field.name != EXTRA_COLUMN)
+        self._names = frozenset(name for name, _ in self._conversions)
+        self._columns = [[] for _ in self._conversions]
+        self._extra = []
+
+    def write(self, event, encoded=None):
+        """
+        Append a single event. `encoded` is accepted for compatibility with EventWriter.
+        """
+        self.event_count += 1
+        if self.schema is None:
+            # Events are kept as they are until the first batch fixes the schema
+            self._pending.append(event)
+            if len(self._pending) >= self.row_group_size:
+                self._start()
+            return
+        self._append(event)
+        if len(self._extra) >= self.row_group_size:
+            self._write_row_group()
+
+    def write_events(self, events):
+        """
+        Append all events of an iterable.
+        """
+        for event in events:
+            self.write(event)
+
+    def _append(self, event):
+        extra = None
+        for (name, convert), column in zip(self._conversions, self._columns):
+            value = event.get(name)
+            if value is not None:
+                converted = convert(value)
+                if converted is _MISMATCH:
+                    extra = extra or {}
+                    extra[name] = value
+                    converted = None
+                value = converted
+            column.append(value)
+        if len(event) > len(self._names) or not self._names.issuperset(event):
+            extra = extra or {}
+            for name, value in event.items():
+                if name not in self._names:
+                    extra[name] = value
+        self._extra.append(json.dumps(extra) if extra else None)
+
+    def _start(self):
+        schema = self._schemas.get(self.log_type)
+        if schema is None:
+            schema = infer_schema(self._pending)
+            if self._pending:
+                self._schemas[self.log_type] = schema
+        self._set_schema(schema)
+        pending, self._pending = self._pending, []
+        for event in pending:
+            self._append(event)
+        self._write_row_group()
+
+    def _write_row_group(self):
+        if not self._extra:
+            return
+        arrays = [pyarrow.array(column, type=field.type)
+                  for column, field in zip(self._columns + [self._extra], self._schema_fields())]
+        table = pyarrow.Table.from_arrays(arrays, schema=self.schema)
+        if self._parquet_writer is None:
+            self._parquet_writer = pyarrow_parquet.ParquetWriter(self._file, self.schema,
+                                                                 compression=self.compression)
+        self._parquet_writer.write_table(table, row_group_size=len(self._extra))
+        self.row_groups += 1
+        self._columns = [[] for _ in self._conversions]
+        self._extra = []
+
+    def _schema_fields(self):
+        return [self.schema.field(name) for name, _ in self._conversions] + [self.schema.field(EXTRA_COLUMN)]
+
+    def close(self):
+        """
+        Write the remaining events and the Parquet footer, so that the file can be uploaded.
+        """
+        if self._file.closed:
+            return
+        if self.schema is None:
+            self._start()
+        else:
+            self._write_row_group()
+        if self._parquet_writer is None:
+            # A file without events still gets a valid footer
+            self._parquet_writer = pyarrow_parquet.ParquetWriter(self._file, self.schema,
+                                                                 compression=self.compression)
+        self._parquet_writer.close()
+        self._file.close()
@@ -0,0 +1,180 @@
+from datetime import datetime, timezone
+from string import Formatter
+
+from cloudwaap_log_utils import CloudWAAPProcessor
+
+
+class _KeyParts:
+    """
+    Lazily parsed view of a source key, shared by the field extractors of one render call.
+    """
+
+    __slots__ = ('key', 'parts', 'output_extension', '_timestamp')
+
+    def __init__(self, key, output_extension, timestamp=None):
+        self.key = key
+        self.parts = key.split('/')
+        self.output_extension = output_extension
+        self._timestamp = timestamp
+
+    @property
+    def file_name(self):
+        return self.parts[-1]
+
+    @property
+    def timestamp(self):
+        # Files without an embedded timestamp are placed by processing time
+        if self._timestamp is None:
+            self._timestamp = CloudWAAPProcessor.parse_log_timestamp(self.key) or datetime.now(timezone.utc)
+        return self._timestamp
+
+
+def _file_stem(parts):
+    name = parts.file_name
+    return name[:-len('.json.gz')] if name.endswith('.json.gz') else name
+
+
+def _application_id(parts):
+    application_id = CloudWAAPProcessor.identify_application_id(parts.key, CloudWAAPProcessor.identify_log_type(parts.key))
+    return application_id if application_id != "Unknown" else ''
+
+
+def _hive_partition(parts):
+    timestamp = parts.timestamp
+    return (f"tenant={CloudWAAPProcessor.parse_tenant_name(parts.key)}"
+            f"/logType={CloudWAAPProcessor.identify_log_type(parts.key)}"
+            f"/dt={timestamp.year:04d}-{timestamp.month:02d}-{timestamp.day:02d}"
+            f"/hour={timestamp.hour:02d}")
+
+
+def _output_extension(parts):
+    # Only Cloud WAAP log files are converted; other files (e.g. the test .txt file) keep their name
+    return parts.output_extension if parts.file_name.endswith('.json.gz') else ''
+
+
+class OutputPathTemplate:
+    """
+    OutputPathTemplate renders destination paths from a template such as
+    "{tenant}/{logType}/{yyyy}/{mm}/{dd}/{file}{ext}".
+
+    The template is compiled once: it is split into path segments, the fields it uses are
+    resolved to extractor functions, and constant segments are pre-rendered. Rendering a key
+    then only parses what the template needs. Segments which render empty are dropped, so
+    optional fields never produce "//" or a leading "/".
+
+    The log time is taken from the timestamp passed to render(), e.g. one derived from the
+    events, then from the timestamp in the file name, and finally from the processing time.
+
+    Available fields:
+        folder       Root folder of the source key, with the suffix mode applied.
+        root         Root folder of the source key, unchanged.
+        path         Folders between the root folder and the file name.
+        dirs         All folders of the source key, unchanged.
+        tenant       Tenant name.
+        logType      Log type ("Access", "WAF", "Bot", ...).
+        application  Application name.
+        applicationId  Application ID folder (Bot logs).
+        yyyy, mm, dd, hh  Date and hour of the log (UTC).
+        dt           Date of the log as "YYYY-MM-DD".
+        hour         Hour of the log as "HH".
+        partition    Hive-style partition path "tenant=.../logType=.../dt=.../hour=...".
+        file         File name without the ".json.gz" extension.
+        ext          Output extension (e.g. ".ndjson").
+    """
+
+    def __init__(self, template, suffix_mode='', original_suffix='', new_suffix=''):
+        """
+        Args:
+            template (str): The path template.
+            suffix_mode (str): "add" or "remove", applied to the {folder} field.
+            original_suffix (str): Suffix removed from the root folder in "remove" mode.
+            new_suffix (str): Suffix added to the root folder in "add" mode.
+
+        Raises:
+            ValueError: If the template uses an unknown field or format syntax.
+        """
+        self.template = template
+        self.suffix_mode = suffix_mode
+        self.original_suffix = original_suffix
+        self.new_suffix = new_suffix
+        self._extractors = self._build_extractors()
+        self._segments = []
+        self._constant_segments = []
+        self._fields = []
+
+        for segment in template.split('/'):
+            if not segment:
+                continue
+            fields = []
+            for _literal, field_name, format_spec, conversion in Formatter().parse(segment):
+                if field_name is None:
+                    continue
+                if field_name not in self._extractors:
+                    raise ValueError(f"Unknown field '{{{field_name}}}' in output path template '{template}'")
+                if format_spec or conversion:
+                    raise ValueError(f"Format specifications are not supported in output path template '{template}'")
+                fields.append(field_name)
+            # Constant segments are pre-rendered once, which also resolves escaped braces
+            self._segments.append(segment if fields else segment.format())
+            self._constant_segments.append(not fields)
+            for field_name in fields:
+                if field_name not in self._fields:
+                    self._fields.append(field_name)
+        self._field_extractors = [(name, self._extractors[name]) for name in self._fields]
+
+    @property
+    def fields(self):
+        """
+        Names of the fields used by the template, in order of first use.
+        """
+        return list(self._fields)
+
+    def _rewrite_folder(self, parts):
+        first_folder = parts.parts[0] if len(parts.parts) > 1 else ''
+        if self.suffix_mode == 'remove':
+            return first_folder.replace(f'-{self.original_suffix}', '')
+        if self.suffix_mode == 'add' and first_folder:
+            return f'{first_folder}-{self.new_suffix}'
+        return first_folder
+
+    def _build_extractors(self):
+        return {
+            'folder': self._rewrite_folder,
+            'root': lambda parts: parts.parts[0] if len(parts.parts) > 1 else '',
+            'path': lambda parts: '/'.join(parts.parts[1:-1]),
+            'dirs': lambda parts: '/'.join(parts.parts[:-1]),
+            'tenant': lambda parts: CloudWAAPProcessor.parse_tenant_name(parts.key),
+            'logType': lambda parts: CloudWAAPProcessor.identify_log_type(parts.key),
+            'application': lambda parts: CloudWAAPProcessor.parse_application_name(parts.key) or '',
+            'applicationId': _application_id,
+            'yyyy': lambda parts: f"{parts.timestamp.year:04d}",
+            'mm': lambda parts: f"{parts.timestamp.month:02d}",
+            'dd': lambda parts: f"{parts.timestamp.day:02d}",
+            'hh': lambda parts: f"{parts.timestamp.hour:02d}",
+            'dt': lambda parts: parts.timestamp.strftime("%Y-%m-%d"),
+            'hour': lambda parts: f"{parts.timestamp.hour:02d}",
+            'partition': _hive_partition,
+            'file': _file_stem,
+            'ext': _output_extension,
+        }
+
+    def render(self, key, output_extension='', timestamp=None):
+        """
+        Render the destination path for a source key.
+
+        Args:
+            key (str): The source S3 key.
+            output_extension (str): Extension of the converted file, including the dot.
+            timestamp (datetime): Log time overriding the timestamp in the file name.
+
+        Returns:
+            str: The rendered path, without leading or duplicate slashes.
+        """
+        parts = _KeyParts(key, output_extension, timestamp)
+        values = {name: extractor(parts) for name, extractor in self._field_extractors}
+        rendered = []
+        for segment, constant in zip(self._segments, self._constant_segments):
+            value = (segment if constant else segment.format_map(values)).strip('/')
+            if value:
+                rendered.append(value)
+        return '/'.join(rendered)
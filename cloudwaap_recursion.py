@@ -0,0 +1,65 @@
+from cloudwaap_destinations import Destination
+
+
+class RecursionGuard:
+    """
+    RecursionGuard recognises objects written by the function itself, so that an Internal
+    S3 output landing in a bucket the function is triggered by is skipped before it is
+    downloaded.
+
+    Only destinations writing into the bucket of the object are considered. An object is
+    an own output when one of them recently wrote it in this container (registry), when
+    its key can only be an output of one of them (pattern), or, if the key is not
+    conclusive, when a HEAD request finds the metadata marker set at upload (marker).
+    """
+
+    REASONS = ("registry", "pattern", "marker")
+
+    def __init__(self, destinations, s3_client):
+        """
+        Args:
+            destinations (dict): Destination objects keyed by name.
+            s3_client: S3 client of the function, used for marker checks.
+        """
+        self.destinations = [destination for destination in destinations.values()
+                             if destination.type == "Internal S3"]
+        self.s3_client = s3_client
+        self.skipped = dict.fromkeys(self.REASONS, 0)
+
+    def check(self, bucket, key):
+        """
+        Return why an object is an own output, or None if it is not one.
+
+        Returns:
+            str or None: "registry", "pattern" or "marker".
+        """
+        reason = self._classify(bucket, key)
+        if reason is not None:
+            self.skipped[reason] += 1
+        return reason
+
+    def _classify(self, bucket, key):
+        candidates = [destination for destination in self.destinations if destination.writes_to(bucket)]
+        if not candidates:
+            return None
+        if any(destination.wrote(bucket, key) for destination in candidates):
+            return "registry"
+        inconclusive = False
+        for destination in candidates:
+            match = destination.matches_output_key(key)
+            if match:
+                return "pattern"
+            if match is None and destination.marks_outputs:
+                inconclusive = True
+        if inconclusive and self._has_marker(bucket, key):
+            return "marker"
+        return None
+
+    def _has_marker(self, bucket, key):
+        try:
+            metadata = self.s3_client.head_object(Bucket=bucket, Key=key).get('Metadata', {})
+        except Exception as e:
+            # A missing object fails again on download and is reported there
+            print(f"Could not check {key} for the output marker: {e}")
+            return False
+        return any(name.lower() == Destination.OUTPUT_MARKER for name in metadata)
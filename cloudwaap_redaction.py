@@ -0,0 +1,199 @@
+import hashlib
+import hmac
+import re
+
+_GLOBAL_FLAGS = re.compile(r"^\(\?([imsx]+)\)")
+
+
+def _field_transform(path, transform, strings_only=True):
+    """
+    Build a function applying `transform` to the value of a (dotted) event field, by
+    default only to non-empty strings.
+    """
+    names = path.split('.')
+    last = names[-1]
+    parents = names[:-1]
+
+    def apply(event):
+        container = event
+        for name in parents:
+            container = container.get(name)
+            if not isinstance(container, dict):
+                return
+        value = container.get(last)
+        if (isinstance(value, str) and value) or (not strings_only and value is not None):
+            container[last] = transform(value)
+    return apply
+
+
+def compile_redaction_patterns(patterns, mask):
+    """
+    Merge the redaction patterns of a field into a single compiled regular expression.
+
+    Every pattern becomes one branch of an alternation, so a field value is scanned once
+    however many patterns apply. A pattern with capture groups masks only its first group,
+    which keeps the context readable (e.g. "token=****"); other patterns mask the whole match.
+
+    Args:
+        patterns (list): Regular expressions.
+        mask (str): Replacement for the redacted text.
+
+    Returns:
+        callable: redact(value) -> value with all matches masked.
+
+    Raises:
+        ValueError: If a pattern is not a valid regular expression.
+    """
+    branches = []
+    for index, pattern in enumerate(patterns):
+        try:
+            groups = re.compile(pattern).groups
+        except re.error as e:
+            raise ValueError(f"Invalid redaction pattern '{pattern}': {e}")
+        # Leading flags such as "(?i)" become scoped flags, which are allowed inside the alternation
+        flags = _GLOBAL_FLAGS.match(pattern)
+        if flags:
+            pattern = f"(?{flags.group(1)}:{pattern[flags.end():]})"
+        branches.append((f"b{index}", pattern, groups))
+    try:
+        combined = re.compile('|'.join(f"(?P<{name}>{pattern})" for name, pattern, _ in branches))
+    except re.error as e:
+        raise ValueError(f"Redaction patterns {patterns} cannot be combined: {e}")
+
+    # Group number of the part to mask, per branch: the first inner group or the branch itself
+    masked_groups = {}
+    for name, _, groups in branches:
+        branch_group = combined.groupindex[name]
+        masked_groups[name] = branch_group + 1 if groups else branch_group
+
+    def replace(match):
+        group = masked_groups[match.lastgroup]
+        start, end = match.span(group)
+        if start < 0:
+            return match.group()
+        match_start = match.start()
+        text = match.group()
+        return text[:start - match_start] + mask + text[end - match_start:]
+
+    return lambda value: combined.sub(replace, value)
+
+
+class IPPseudonymizer:
+    """
+    IPPseudonymizer replaces IP addresses with keyed HMAC-SHA256 pseudonyms.
+
+    The same address always maps to the same pseudonym, so events of one client can still
+    be correlated, but the address cannot be recovered without the key. Client addresses
+    repeat thousands of times per file, so pseudonyms are memoized per container.
+    """
+
+    CACHE_SIZE = 100000
+
+    def __init__(self, key, length=16, prefix="ip-"):
+        """
+        Args:
+            key (str or bytes): Secret HMAC key.
+            length (int): Number of hex digits of the pseudonym.
+            prefix (str): Prefix marking pseudonymized values.
+
+        Raises:
+            ValueError: If the key is empty.
+        """
+        if not key:
+            raise ValueError("IP pseudonymization requires a key")
+        self.key = key.encode('utf-8') if isinstance(key, str) else key
+        self.length = length
+        self.prefix = prefix
+        self._cache = {}
+
+    def pseudonymize(self, address):
+        """
+        Return the pseudonym of an address.
+        """
+        pseudonym = self._cache.get(address)
+        if pseudonym is None:
+            digest = hmac.new(self.key, address.encode('utf-8'), hashlib.sha256).hexdigest()
+            pseudonym = self.prefix + digest[:self.length]
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.clear()
+            self._cache[address] = pseudonym
+        return pseudonym
+
+
+class Redactor:
+    """
+    Redactor masks secrets and personal data in log events before they leave the account.
+
+    Per log type ("*" applies to log types without an entry of their own) it supports:
+        patterns    Field -> regular expressions; matching text is masked.
+        fields      Fields masked completely, e.g. cookies and authorization headers.
+    and, for all log types, pseudonymization of IP address fields.
+
+    Everything is compiled once per log type into a list of field operations applied to
+    the event stream. Field names may be dotted to reach into nested objects.
+    """
+
+    def __init__(self, patterns=None, fields=None, ip_fields=None, pseudonymizer=None, mask="****"):
+        """
+        Args:
+            patterns (dict): Log type -> {field: [regular expressions]}.
+            fields (dict): Log type -> [fields masked completely].
+            ip_fields (list): Fields holding IP addresses to pseudonymize.
+            pseudonymizer (IPPseudonymizer): Pseudonymizer used for the IP fields.
+            mask (str): Replacement for redacted text.
+
+        Raises:
+            ValueError: If a pattern is invalid or IP fields are set without a pseudonymizer.
+        """
+        if ip_fields and pseudonymizer is None:
+            raise ValueError("IP fields to pseudonymize require a pseudonymization key")
+        self.mask = mask
+        self._patterns = {log_type: {field: compile_redaction_patterns(field_patterns, mask)
+                                     for field, field_patterns in field_map.items()}
+                          for log_type, field_map in (patterns or {}).items()}
+        self._fields = {log_type: list(field_list) for log_type, field_list in (fields or {}).items()}
+        self._ip_operations = [_field_transform(field, pseudonymizer.pseudonymize) for field in ip_fields or ()]
+        self._plans = {}
+
+    def applies_to(self, log_type):
+        """
+        Return True if events of the log type are redacted.
+        """
+        return self.plan(log_type) is not None
+
+    def plan(self, log_type):
+        """
+        Return the compiled redaction for a log type, or None if there is nothing to redact.
+
+        The plan is a function taking an event stream and returning a generator of the
+        redacted events.
+        """
+        try:
+            return self._plans[log_type]
+        except KeyError:
+            pass
+        mask = self.mask
+        operations = [_field_transform(field, lambda value: mask, strings_only=False)
+                      for field in self._fields.get(log_type, self._fields.get("*", ()))]
+        operations.extend(_field_transform(field, redact)
+                          for field, redact in self._patterns.get(log_type, self._patterns.get("*", {})).items())
+        operations.extend(self._ip_operations)
+        operations = tuple(operations)
+        if not operations:
+            self._plans[log_type] = None
+            return None
+
+        def apply(events):
+            for event in events:
+                for operation in operations:
+                    operation(event)
+                yield event
+        self._plans[log_type] = apply
+        return apply
+
+    def apply(self, events, log_type):
+        """
+        Redact a stream of events of one log type.
+        """
+        plan = self.plan(log_type)
+        return plan(events) if plan is not None else events
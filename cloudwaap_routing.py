@@ -0,0 +1,146 @@
+from cloudwaap_log_utils import CloudWAAPProcessor, LOG_TIMESTAMP_PATTERN
+
+
+class FileRoute:
+    """
+    FileRoute is the routing decision for one log file.
+
+    When no rule that applies to the file looks at event fields, the whole file goes to
+    `static` and route() is a constant. Otherwise route() checks the event rules in order
+    and falls back to `fallback`.
+    """
+
+    __slots__ = ('static', 'rules', 'fallback', 'destinations')
+
+    def __init__(self, rules, fallback):
+        self.rules = rules
+        self.fallback = fallback
+        self.static = None if rules else fallback
+        names = []
+        for _, destinations in rules + [(None, fallback)]:
+            names.extend(name for name in destinations if name not in names)
+        # Every destination the file can be routed to
+        self.destinations = tuple(names)
+
+    def route(self, event):
+        """
+        Return the names of the destinations an event is routed to.
+        """
+        if self.static is not None:
+            return self.static
+        for predicate, destinations in self.rules:
+            if predicate(event):
+                return destinations
+        return self.fallback
+
+
+class RoutingTable:
+    """
+    RoutingTable routes log files, or individual events, to named destinations.
+
+    Rules are checked in order and the first matching rule decides. A rule matches on the
+    file attributes "logType", "tenant", "application" and "applicationId", and optionally
+    on event fields under "event":
+
+        {"match": {"logType": ["WAF", "Bot"]}, "destinations": ["siem"]}
+        {"match": {"logType": "Access", "event": {"action": "Blocked"}}, "destinations": ["siem", "archive"]}
+
+    Each condition accepts a single value or a list of values. Files matched by no rule
+    go to the default destinations.
+
+    Rules are compiled once. The file attributes are resolved per key prefix (the key up to
+    the timestamp in the file name) and the resulting FileRoute is cached, so routing the
+    files of a known application costs a single dict lookup.
+    """
+
+    FILE_FIELDS = ("logType", "tenant", "application", "applicationId")
+    CACHE_SIZE = 4096
+
+    def __init__(self, rules, default_destinations, known_destinations=None):
+        """
+        Args:
+            rules (list): Routing rules as described above.
+            default_destinations (list): Destination names for files matched by no rule.
+            known_destinations (iterable): Valid destination names, used to validate the rules.
+
+        Raises:
+            ValueError: If a rule is malformed or names an unknown destination.
+        """
+        known = set(known_destinations) if known_destinations is not None else None
+        self.default_destinations = self._destination_tuple(default_destinations, known, "default route")
+        self._rules = [self._compile_rule(index, rule, known) for index, rule in enumerate(rules)]
+        self._cache = {}
+
+    @staticmethod
+    def _values(value):
+        return frozenset(str(item) for item in value) if isinstance(value, (list, tuple, set)) else frozenset([str(value)])
+
+    @staticmethod
+    def _destination_tuple(destinations, known, label):
+        destinations = tuple([destinations] if isinstance(destinations, str) else destinations)
+        if not destinations:
+            raise ValueError(f"No destinations configured for the {label}")
+        if known is not None:
+            unknown = [name for name in destinations if name not in known]
+            if unknown:
+                raise ValueError(f"Unknown destinations {unknown} in the {label}")
+        return destinations
+
+    def _compile_rule(self, index, rule, known):
+        match = dict(rule.get("match", {}))
+        event_match = match.pop("event", None) or {}
+        unknown_fields = [field for field in match if field not in self.FILE_FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Unknown match fields {unknown_fields} in routing rule {index}")
+
+        file_conditions = [(field, self._values(value)) for field, value in match.items()]
+        event_conditions = [(field, self._values(value)) for field, value in event_match.items()]
+        destinations = self._destination_tuple(rule.get("destinations"), known, f"routing rule {index}")
+        return file_conditions, self._compile_event_predicate(event_conditions), destinations
+
+    @staticmethod
+    def _compile_event_predicate(conditions):
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            (field, allowed), = conditions
+            return lambda event: str(event.get(field)) in allowed
+        return lambda event: all(str(event.get(field)) in allowed for field, allowed in conditions)
+
+    @staticmethod
+    def _file_attributes(key):
+        log_type = CloudWAAPProcessor.identify_log_type(key)
+        application_id = CloudWAAPProcessor.identify_application_id(key, log_type)
+        return {
+            "logType": log_type,
+            "tenant": CloudWAAPProcessor.parse_tenant_name(key),
+            "application": CloudWAAPProcessor.parse_application_name(key) or "",
+            "applicationId": application_id if application_id != "Unknown" else "",
+        }
+
+    def route_file(self, key):
+        """
+        Return the FileRoute for a source key.
+        """
+        match = LOG_TIMESTAMP_PATTERN.search(key)
+        cache_key = key[:match.start()] if match else key
+        route = self._cache.get(cache_key)
+        if route is not None:
+            return route
+
+        attributes = self._file_attributes(key)
+        event_rules = []
+        fallback = self.default_destinations
+        for file_conditions, event_predicate, destinations in self._rules:
+            if not all(attributes[field] in allowed for field, allowed in file_conditions):
+                continue
+            if event_predicate is None:
+                fallback = destinations
+                break
+            event_rules.append((event_predicate, destinations))
+
+        route = FileRoute(event_rules, fallback)
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[cache_key] = route
+        return route
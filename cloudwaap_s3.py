@@ -0,0 +1,683 @@
+import base64
+import hashlib
+import hmac
+import os
+import xml.etree.ElementTree as ElementTree
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote, unquote_plus, urlsplit
+
+import certifi
+import urllib3
+
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+
+# Subresources that are part of the string to sign of signature version 2
+_V2_SUBRESOURCES = ("delete", "partNumber", "uploadId", "uploads")
+
+
+class S3Error(Exception):
+    """
+    Error response of S3 (or Lambda). `response` has the shape of botocore's ClientError.response, so
+    callers can check error codes the same way for both clients.
+    """
+
+    def __init__(self, code, message, status, operation):
+        super().__init__(f"An error occurred ({code}) when calling the {operation} operation: {message}")
+        self.response = {'Error': {'Code': code, 'Message': message},
+                         'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+class _Body:
+    """
+    Response body with the read() interface of botocore's StreamingBody.
+    """
+
+    def __init__(self, data):
+        self._stream = memoryview(data)
+        self._position = 0
+
+    def read(self, amt=None):
+        end = len(self._stream) if amt is None else min(len(self._stream), self._position + amt)
+        data = self._stream[self._position:end].tobytes()
+        self._position = end
+        return data
+
+    def close(self):
+        pass
+
+
+def _strip_namespace(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _xml_fields(element):
+    """
+    Return the text of the direct children of an XML element by tag, without namespaces.
+    """
+    return {_strip_namespace(child.tag): child.text or '' for child in element}
+
+
+def _canonical_request(method, path, query, headers, payload_hash):
+    """
+    Build the canonical request of signature version 4.
+
+    Returns:
+        tuple: (canonical request, signed header names joined by ";").
+    """
+    signed_headers = ';'.join(sorted(headers))
+    canonical_headers = ''.join(f"{name}:{' '.join(str(headers[name]).split())}\n" for name in sorted(headers))
+    canonical_query = '&'.join(f"{quote(name, safe='~')}={quote(str(value), safe='~')}"
+                               for name, value in sorted(query.items()))
+    return '\n'.join((method, path, canonical_query, canonical_headers, signed_headers, payload_hash)), signed_headers
+
+
+def _string_to_sign(amz_date, scope, canonical_request):
+    return '\n'.join(('AWS4-HMAC-SHA256', amz_date, scope, hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()))
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+class S3Client:
+    """
+    S3Client is a minimal S3 client on the vendored urllib3, a drop-in replacement for the
+    part of the boto3 S3 client used by this function.
+
+    Importing boto3 and creating its client is the largest part of the cold start; this
+    client only needs hashlib and a urllib3 PoolManager, whose connections are reused
+    across invocations. Requests are signed with signature version 4 ("s3v4"), or with
+    version 2 ("s3") for S3 compatible stores such as Dell ECS.
+
+    Operations take and return the same arguments and dictionaries as boto3, for the
+    subset that is implemented: get_object (with ranges), head_object, put_object,
+    copy_object, delete_object, delete_objects, list_objects_v2, multipart uploads and
+    the upload_file and download_file transfers. Errors raise S3Error.
+    """
+
+    MULTIPART_THRESHOLD = 8 * 1024 * 1024
+    PART_SIZE = 8 * 1024 * 1024
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, region=None, access_key_id=None, secret_access_key=None, session_token=None,
+                 endpoint_url=None, signature_version='s3v4', verify=True, max_connections=10, retries=3):
+        """
+        Args:
+            region (str): AWS region, by default from AWS_REGION.
+            access_key_id (str): Access key, by default the function's credentials from the environment
+                (AWS_ACCESS_KEY_ID, set by the Lambda runtime). Other credential sources are not searched.
+            secret_access_key (str): Secret key, by default from the environment.
+            session_token (str): Session token of temporary credentials, by default from the environment.
+            endpoint_url (str): Endpoint of an S3 compatible store, addressed path-style. By
+                default from AWS_ENDPOINT_URL_S3 or AWS_ENDPOINT_URL, as with boto3.
+            signature_version (str): "s3v4", or "s3" or "s3v2" for version 2.
+            verify (bool or str): Whether to verify TLS certificates, or the path of a CA bundle.
+            max_connections (int): Connections kept per host.
+            retries (int): Retries of failed connections and 5xx responses.
+
+        Raises:
+            ValueError: If the signature version is not supported, or no credentials are available.
+        """
+        if signature_version not in ("s3v4", "s3", "s3v2"):
+            raise ValueError(f"Unsupported S3 signature version '{signature_version}'")
+        if not access_key_id:
+            access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
+            secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+            session_token = os.getenv('AWS_SESSION_TOKEN')
+        if not access_key_id or not secret_access_key:
+            # Profiles, SSO and instance or container roles are only resolved by boto3
+            raise ValueError("The native S3 client needs credentials in AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY, "
+                             "as set by the Lambda runtime, or passed explicitly. Use the 'boto3' client for "
+                             "profiles, SSO and instance or container roles.")
+        self.region = region or os.getenv('AWS_REGION') or os.getenv('AWS_DEFAULT_REGION') or 'us-east-1'
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.session_token = session_token
+        endpoint_url = endpoint_url or os.getenv('AWS_ENDPOINT_URL_S3') or os.getenv('AWS_ENDPOINT_URL')
+        self.endpoint_url = endpoint_url.rstrip('/') if endpoint_url else None
+        self.signature_version = signature_version
+        self._signing_keys = {}
+        # Regions of buckets found outside of the client's region
+        self._bucket_regions = {}
+
+        if verify is False:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            pool_options = {'cert_reqs': 'CERT_NONE'}
+        else:
+            ca_certs = verify if isinstance(verify, str) else certifi.where()
+            pool_options = {'cert_reqs': 'CERT_REQUIRED', 'ca_certs': ca_certs}
+        retry = urllib3.Retry(total=retries, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504),
+                              allowed_methods=None, raise_on_status=False)
+        self._http = urllib3.PoolManager(maxsize=max_connections, retries=retry, **pool_options)
+
+    # Request signing
+
+    def _location(self, bucket, key, region):
+        """
+        Return (base URL, host, canonical path) of an object or bucket.
+        """
+        path = quote(key, safe='/~')
+        if self.endpoint_url:
+            parts = urlsplit(self.endpoint_url)
+            return (f"{parts.scheme}://{parts.netloc}", parts.netloc,
+                    f"{parts.path}/{bucket}/{path}" if bucket else f"{parts.path}/")
+        if bucket and '.' not in bucket:
+            host = f"{bucket}.s3.{region}.amazonaws.com"
+            return f"https://{host}", host, f"/{path}"
+        # Bucket names with dots do not match the wildcard certificate, so they are addressed path-style
+        host = f"s3.{region}.amazonaws.com"
+        return f"https://{host}", host, f"/{bucket}/{path}"
+
+    def _signing_key(self, date, region, service):
+        key = self._signing_keys.get((date, region, service))
+        if key is None:
+            key = ('AWS4' + self.secret_access_key).encode('utf-8')
+            for part in (date, region, service, 'aws4_request'):
+                key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+            # Keys of earlier days are dropped
+            self._signing_keys = {scope: value for scope, value in self._signing_keys.items() if scope[0] == date}
+            self._signing_keys[(date, region, service)] = key
+        return key
+
+    def _sign_v4(self, method, host, path, query, headers, payload_hash, region=None, service='s3', now=None):
+        amz_date = (now or datetime.now(timezone.utc)).strftime('%Y%m%dT%H%M%SZ')
+        date = amz_date[:8]
+        headers['host'] = host
+        headers['x-amz-date'] = amz_date
+        headers['x-amz-content-sha256'] = payload_hash
+        if self.session_token:
+            headers['x-amz-security-token'] = self.session_token
+        canonical_request, signed_headers = _canonical_request(method, path, query, headers, payload_hash)
+        region = region or self.region
+        scope = f"{date}/{region}/{service}/aws4_request"
+        string_to_sign = _string_to_sign(amz_date, scope, canonical_request)
+        signature = hmac.new(self._signing_key(date, region, service), string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        headers['authorization'] = (f"AWS4-HMAC-SHA256 Credential={self.access_key_id}/{scope}, "
+                                    f"SignedHeaders={signed_headers}, Signature={signature}")
+
+    def _sign_v2(self, method, bucket, key, query, headers):
+        headers['date'] = formatdate(usegmt=True)
+        if self.session_token:
+            headers['x-amz-security-token'] = self.session_token
+        amz_headers = ''.join(f"{name}:{headers[name]}\n" for name in sorted(headers) if name.startswith('x-amz-'))
+        resource = f"/{bucket}/{quote(key, safe='/~')}" if bucket else "/"
+        subresources = [name if query[name] == '' else f"{name}={query[name]}"
+                        for name in sorted(query) if name in _V2_SUBRESOURCES]
+        if subresources:
+            resource += '?' + '&'.join(subresources)
+        string_to_sign = '\n'.join((method, headers.get('content-md5', ''), headers.get('content-type', ''),
+                                    headers['date'], amz_headers + resource))
+        signature = base64.b64encode(hmac.new(self.secret_access_key.encode('utf-8'), string_to_sign.encode('utf-8'),
+                                              hashlib.sha1).digest()).decode('ascii')
+        headers['authorization'] = f"AWS {self.access_key_id}:{signature}"
+
+    def _request(self, operation, method, bucket, key='', query=None, headers=None, body=b'',
+                 expected=(200,), stream=False):
+        query = query or {}
+        request_headers = headers
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+        region = self._bucket_regions.get(bucket, self.region)
+        base_url, host, path = self._location(bucket, key, region)
+        if self.signature_version == "s3v4":
+            payload_hash = hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256
+            self._sign_v4(method, host, path, query, headers, payload_hash, region)
+        else:
+            self._sign_v2(method, bucket, key, query, headers)
+        url = base_url + path
+        if query:
+            url += '?' + '&'.join(quote(name, safe='~') if value == '' else
+                                  f"{quote(name, safe='~')}={quote(str(value), safe='~')}"
+                                  for name, value in query.items())
+        # Bodies are returned as stored, like boto3 does: a gzip object with "Content-Encoding: gzip" stays gzip
+        response = self._http.request(method, url, body=body or None, headers=headers, preload_content=not stream,
+                                      decode_content=False, redirect=False)
+        if response.status not in expected:
+            data = response.data if not stream else response.read(decode_content=False)
+            response.release_conn()
+            # A bucket in another region answers with its region; the request is repeated there once
+            bucket_region = response.headers.get('x-amz-bucket-region') or self._error_region(data)
+            if (bucket and not self.endpoint_url and bucket_region and bucket_region != region
+                    and response.status in (301, 307, 400)):
+                self._bucket_regions[bucket] = bucket_region
+                return self._request(operation, method, bucket, key, query, request_headers, body, expected, stream)
+            self._raise_error(operation, response.status, data)
+        return response
+
+    @staticmethod
+    def _raise_error(operation, status, data):
+        code, message = str(status), ''
+        if data:
+            try:
+                fields = _xml_fields(ElementTree.fromstring(data))
+                code = fields.get('Code') or code
+                message = fields.get('Message', '')
+            except ElementTree.ParseError:
+                message = data[:200].decode('utf-8', 'replace')
+        raise S3Error(code, message, status, operation)
+
+    @staticmethod
+    def _error_region(data):
+        # AuthorizationHeaderMalformed names the bucket's region in the error document
+        try:
+            return _xml_fields(ElementTree.fromstring(data)).get('Region') if data else None
+        except ElementTree.ParseError:
+            return None
+
+    @classmethod
+    def _check_embedded_error(cls, operation, response):
+        # CopyObject and CompleteMultipartUpload can fail after answering 200
+        root = ElementTree.fromstring(response.data)
+        if _strip_namespace(root.tag) == 'Error':
+            cls._raise_error(operation, response.status, response.data)
+        return root
+
+    @staticmethod
+    def _object_fields(response):
+        headers = response.headers
+        result = {
+            'ETag': headers.get('ETag'),
+            'ContentLength': int(headers.get('Content-Length', 0)),
+            'ContentType': headers.get('Content-Type'),
+            'Metadata': {name[len('x-amz-meta-'):]: value for name, value in headers.items()
+                         if name.lower().startswith('x-amz-meta-')},
+        }
+        if headers.get('Last-Modified'):
+            result['LastModified'] = parsedate_to_datetime(headers['Last-Modified'])
+        if headers.get('Content-Range'):
+            result['ContentRange'] = headers['Content-Range']
+        return result
+
+    @staticmethod
+    def _put_headers(content_type=None, metadata=None, extra=None):
+        headers = dict(extra or {})
+        if content_type:
+            headers['content-type'] = content_type
+        for name, value in (metadata or {}).items():
+            headers[f'x-amz-meta-{name.lower()}'] = value
+        return headers
+
+    # Objects
+
+    def get_object(self, Bucket, Key, Range=None, IfNoneMatch=None, IfMatch=None):
+        """
+        Read an object, or a byte range of it ("bytes=0-1023").
+        """
+        headers = {}
+        if Range:
+            headers['range'] = Range
+        if IfNoneMatch:
+            headers['if-none-match'] = IfNoneMatch
+        if IfMatch:
+            headers['if-match'] = IfMatch
+        response = self._request('GetObject', 'GET', Bucket, Key, headers=headers, expected=(200, 206))
+        result = self._object_fields(response)
+        result['Body'] = _Body(response.data)
+        return result
+
+    def head_object(self, Bucket, Key):
+        """
+        Read the metadata of an object.
+        """
+        return self._object_fields(self._request('HeadObject', 'HEAD', Bucket, Key))
+
+    def put_object(self, Bucket, Key, Body=b'', ContentType=None, Metadata=None, IfMatch=None, IfNoneMatch=None):
+        """
+        Write an object from bytes (or a string), optionally only if it still has an ETag
+        (IfMatch) or does not exist yet (IfNoneMatch="*").
+        """
+        body = Body.encode('utf-8') if isinstance(Body, str) else Body
+        headers = self._put_headers(ContentType, Metadata)
+        if IfMatch:
+            headers['if-match'] = IfMatch
+        if IfNoneMatch:
+            headers['if-none-match'] = IfNoneMatch
+        response = self._request('PutObject', 'PUT', Bucket, Key, headers=headers, body=body)
+        return {'ETag': response.headers.get('ETag')}
+
+    def copy_object(self, Bucket, Key, CopySource, Metadata=None, MetadataDirective=None, ContentType=None):
+        """
+        Copy an object within S3. CopySource is {"Bucket": ..., "Key": ...} or "bucket/key".
+        """
+        if isinstance(CopySource, dict):
+            CopySource = f"{CopySource['Bucket']}/{CopySource['Key']}"
+        headers = self._put_headers(ContentType, Metadata, {'x-amz-copy-source': quote(CopySource, safe='/~')})
+        if MetadataDirective:
+            headers['x-amz-metadata-directive'] = MetadataDirective
+        response = self._request('CopyObject', 'PUT', Bucket, Key, headers=headers)
+        fields = _xml_fields(self._check_embedded_error('CopyObject', response))
+        return {'CopyObjectResult': {'ETag': fields.get('ETag'), 'LastModified': _parse_time(fields.get('LastModified'))}}
+
+    def delete_object(self, Bucket, Key):
+        """
+        Delete an object.
+        """
+        self._request('DeleteObject', 'DELETE', Bucket, Key, expected=(200, 204))
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        """
+        Delete up to 1000 objects in one request. Delete is {"Objects": [{"Key": ...}], "Quiet": bool}.
+
+        Returns:
+            dict: "Deleted" and "Errors" lists as returned by boto3.
+        """
+        root = ElementTree.Element('Delete')
+        ElementTree.SubElement(root, 'Quiet').text = 'true' if Delete.get('Quiet') else 'false'
+        for item in Delete['Objects']:
+            ElementTree.SubElement(ElementTree.SubElement(root, 'Object'), 'Key').text = item['Key']
+        body = ElementTree.tostring(root, encoding='utf-8')
+        headers = {'content-md5': base64.b64encode(hashlib.md5(body).digest()).decode('ascii'),
+                   'content-type': 'application/xml'}
+        response = self._request('DeleteObjects', 'POST', Bucket, query={'delete': ''}, headers=headers, body=body)
+        result = {'Deleted': [], 'Errors': []}
+        for child in ElementTree.fromstring(response.data):
+            tag = _strip_namespace(child.tag)
+            if tag in ('Deleted', 'Error'):
+                result['Deleted' if tag == 'Deleted' else 'Errors'].append(_xml_fields(child))
+        return result
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, StartAfter=None,
+                        Delimiter=None):
+        """
+        List one page of objects.
+        """
+        query = {'list-type': '2', 'encoding-type': 'url', 'max-keys': str(MaxKeys)}
+        if Prefix:
+            query['prefix'] = Prefix
+        if ContinuationToken:
+            query['continuation-token'] = ContinuationToken
+        if StartAfter:
+            query['start-after'] = StartAfter
+        if Delimiter:
+            query['delimiter'] = Delimiter
+        root = ElementTree.fromstring(self._request('ListObjectsV2', 'GET', Bucket, query=query).data)
+        result = {'Contents': [], 'CommonPrefixes': []}
+        for child in root:
+            tag = _strip_namespace(child.tag)
+            if tag == 'Contents':
+                fields = _xml_fields(child)
+                result['Contents'].append({'Key': unquote_plus(fields['Key']),
+                                           'LastModified': _parse_time(fields.get('LastModified')),
+                                           'ETag': fields.get('ETag'), 'Size': int(fields.get('Size', 0)),
+                                           'StorageClass': fields.get('StorageClass')})
+            elif tag == 'CommonPrefixes':
+                result['CommonPrefixes'].append({'Prefix': unquote_plus(_xml_fields(child).get('Prefix', ''))})
+            elif tag == 'IsTruncated':
+                result['IsTruncated'] = child.text == 'true'
+            elif tag in ('NextContinuationToken', 'KeyCount'):
+                result[tag] = int(child.text) if tag == 'KeyCount' else child.text
+        if not result['Contents']:
+            del result['Contents']
+        return result
+
+    # Multipart uploads
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, Metadata=None):
+        """
+        Start a multipart upload.
+
+        Returns:
+            dict: {"UploadId": ...}.
+        """
+        response = self._request('CreateMultipartUpload', 'POST', Bucket, Key, query={'uploads': ''},
+                                 headers=self._put_headers(ContentType, Metadata))
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': _xml_fields(ElementTree.fromstring(response.data))['UploadId']}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        """
+        Upload one part (at least 5 MiB, except the last one).
+
+        Returns:
+            dict: {"ETag": ...}.
+        """
+        response = self._request('UploadPart', 'PUT', Bucket, Key,
+                                 query={'partNumber': str(PartNumber), 'uploadId': UploadId}, body=Body)
+        return {'ETag': response.headers.get('ETag')}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        """
+        Complete a multipart upload. MultipartUpload is {"Parts": [{"PartNumber": n, "ETag": ...}]}.
+        """
+        root = ElementTree.Element('CompleteMultipartUpload')
+        for part in MultipartUpload['Parts']:
+            element = ElementTree.SubElement(root, 'Part')
+            ElementTree.SubElement(element, 'PartNumber').text = str(part['PartNumber'])
+            ElementTree.SubElement(element, 'ETag').text = part['ETag']
+        response = self._request('CompleteMultipartUpload', 'POST', Bucket, Key, query={'uploadId': UploadId},
+                                 headers={'content-type': 'application/xml'},
+                                 body=ElementTree.tostring(root, encoding='utf-8'))
+        return {'ETag': _xml_fields(self._check_embedded_error('CompleteMultipartUpload', response)).get('ETag')}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        """
+        Abort a multipart upload and discard its parts.
+        """
+        self._request('AbortMultipartUpload', 'DELETE', Bucket, Key, query={'uploadId': UploadId}, expected=(200, 204))
+        return {}
+
+    # Transfers
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        """
+        Upload a local file, in parts if it is larger than MULTIPART_THRESHOLD.
+        """
+        extra = ExtraArgs or {}
+        options = {'ContentType': extra.get('ContentType'), 'Metadata': extra.get('Metadata')}
+        with open(Filename, 'rb') as f:
+            if os.path.getsize(Filename) < self.MULTIPART_THRESHOLD:
+                self.put_object(Bucket=Bucket, Key=Key, Body=f.read(), **options)
+                return
+            upload_id = self.create_multipart_upload(Bucket=Bucket, Key=Key, **options)['UploadId']
+            try:
+                parts = []
+                while True:
+                    data = f.read(self.PART_SIZE)
+                    if not data:
+                        break
+                    part_number = len(parts) + 1
+                    etag = self.upload_part(Bucket=Bucket, Key=Key, UploadId=upload_id, PartNumber=part_number,
+                                            Body=data)['ETag']
+                    parts.append({'PartNumber': part_number, 'ETag': etag})
+                self.complete_multipart_upload(Bucket=Bucket, Key=Key, UploadId=upload_id,
+                                               MultipartUpload={'Parts': parts})
+            except Exception:
+                self.abort_multipart_upload(Bucket=Bucket, Key=Key, UploadId=upload_id)
+                raise
+
+    def download_file(self, Bucket, Key, Filename):
+        """
+        Download an object to a local file, streaming it in chunks.
+        """
+        response = self._request('GetObject', 'GET', Bucket, Key, stream=True)
+        try:
+            with open(Filename, 'wb') as f:
+                for chunk in response.stream(self.CHUNK_SIZE, decode_content=False):
+                    f.write(chunk)
+        finally:
+            response.release_conn()
+
+
+def create_s3_client(implementation="boto3", region=None, access_key_id=None, secret_access_key=None,
+                     endpoint_url=None, signature_version=None, verify=True):
+    """
+    Create an S3 client: the built-in S3Client, or a boto3 client when "boto3" is requested.
+    boto3 is only imported in that case.
+
+    Args:
+        implementation (str): "native" or "boto3".
+        region (str): AWS region.
+        access_key_id (str): Access key, by default the function's credentials.
+        secret_access_key (str): Secret key.
+        endpoint_url (str): Endpoint of an S3 compatible store.
+        signature_version (str): "s3v4", or "s3" or "s3v2" for version 2; by default version 4.
+        verify (bool or str): Whether to verify TLS certificates, or the path of a CA bundle.
+
+    Raises:
+        ValueError: If the implementation is unknown.
+    """
+    if implementation == "native":
+        return S3Client(region, access_key_id, secret_access_key, endpoint_url=endpoint_url,
+                        signature_version=signature_version or 's3v4', verify=verify)
+    if implementation != "boto3":
+        raise ValueError(f"Unknown S3 client '{implementation}', expected 'native' or 'boto3'")
+    import boto3
+    options = {}
+    if region:
+        options['region_name'] = region
+    if access_key_id:
+        options['aws_access_key_id'] = access_key_id
+        options['aws_secret_access_key'] = secret_access_key
+    if endpoint_url:
+        options['endpoint_url'] = endpoint_url
+        options['verify'] = verify
+    if signature_version:
+        from botocore.client import Config
+        options['config'] = Config(signature_version=signature_version)
+    return boto3.client('s3', **options)
+
+
+class LambdaClient(S3Client):
+    """
+    LambdaClient invokes Lambda functions with the request signing and connection pool of
+    S3Client, so that the function can invoke itself without importing boto3.
+
+    Only invoke() is implemented, with the arguments of the boto3 Lambda client. Errors
+    raise S3Error, with the error type of the Lambda response as its code.
+    """
+
+    def __init__(self, region=None, endpoint_url=None, **options):
+        """
+        Args:
+            region (str): AWS region, by default from AWS_REGION.
+            endpoint_url (str): Endpoint of the Lambda API. By default from AWS_ENDPOINT_URL_LAMBDA
+                or AWS_ENDPOINT_URL, as with boto3.
+            **options: Other S3Client options (credentials, verify, retries).
+        """
+        super().__init__(region, **options)
+        endpoint_url = endpoint_url or os.getenv('AWS_ENDPOINT_URL_LAMBDA') or os.getenv('AWS_ENDPOINT_URL')
+        self.endpoint_url = endpoint_url.rstrip('/') if endpoint_url else None
+
+    def invoke(self, FunctionName, InvocationType='RequestResponse', Payload=b'', Qualifier=None):
+        """
+        Invoke a function by name or ARN ("arn:aws:lambda:region:account:function:name[:qualifier]").
+        """
+        region = self.region
+        if FunctionName.startswith('arn:'):
+            parts = FunctionName.split(':')
+            region, FunctionName = parts[3], parts[6]
+            if len(parts) > 7:
+                Qualifier = parts[7]
+        body = Payload.encode('utf-8') if isinstance(Payload, str) else Payload
+        query = {'Qualifier': Qualifier} if Qualifier else {}
+        path = f"/2015-03-31/functions/{quote(FunctionName, safe='')}/invocations"
+        if self.endpoint_url:
+            parts = urlsplit(self.endpoint_url)
+            base_url, host = f"{parts.scheme}://{parts.netloc}", parts.netloc
+        else:
+            host = f"lambda.{region}.amazonaws.com"
+            base_url = f"https://{host}"
+        headers = {'x-amz-invocation-type': InvocationType, 'content-type': 'application/json'}
+        self._sign_v4('POST', host, path, query, headers, hashlib.sha256(body).hexdigest(), region, 'lambda')
+        url = base_url + path
+        if query:
+            url += '?' + '&'.join(f"{name}={quote(str(value), safe='~')}" for name, value in query.items())
+        response = self._http.request('POST', url, body=body, headers=headers)
+        if response.status not in (200, 202, 204):
+            code = response.headers.get('x-amzn-ErrorType', str(response.status)).split(':')[0]
+            raise S3Error(code, response.data[:200].decode('utf-8', 'replace'), response.status, 'Invoke')
+        return {'StatusCode': response.status, 'Payload': _Body(response.data)}
+
+
+def create_lambda_client(implementation="boto3", region=None):
+    """
+    Create a Lambda client: the built-in LambdaClient, or a boto3 client when "boto3" is
+    requested, following the S3_CLIENT choice. boto3 is only imported in that case.
+
+    Args:
+        implementation (str): "native" or "boto3".
+        region (str): AWS region.
+
+    Raises:
+        ValueError: If the implementation is unknown.
+    """
+    if implementation == "native":
+        return LambdaClient(region)
+    if implementation != "boto3":
+        raise ValueError(f"Unknown Lambda client '{implementation}', expected 'native' or 'boto3'")
+    import boto3
+    return boto3.client('lambda', **({'region_name': region} if region else {}))
+
+
+class DeleteBatcher:
+    """
+    DeleteBatcher collects the keys of delivered originals per bucket and deletes them with
+    DeleteObjects, up to `batch_size` keys per request, instead of one DeleteObject request
+    per key.
+
+    A bucket's batch is sent as soon as it is full; everything else is sent by flush(),
+    at the end of an invocation. Keys that could not be deleted are collected until the
+    next flush() returns them.
+    """
+
+    MAX_BATCH_SIZE = 1000
+
+    def __init__(self, s3_client, batch_size=1000):
+        """
+        Args:
+            s3_client: S3 client of the buckets (native or boto3).
+            batch_size (int): Keys per DeleteObjects request, at most 1000.
+        """
+        self.s3_client = s3_client
+        self.batch_size = min(self.MAX_BATCH_SIZE, max(1, int(batch_size)))
+        self.deleted = 0
+        self.requests = 0
+        self._pending = {}
+        self._failed = []
+
+    def add(self, bucket, key):
+        """
+        Schedule the deletion of an object.
+        """
+        keys = self._pending.setdefault(bucket, [])
+        keys.append(key)
+        if len(keys) >= self.batch_size:
+            self._delete(bucket, self._pending.pop(bucket))
+
+    def _delete(self, bucket, keys):
+        self.requests += 1
+        try:
+            response = self.s3_client.delete_objects(
+                Bucket=bucket, Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+        except Exception as e:
+            # The whole request failed, so none of its keys were deleted
+            error = getattr(e, 'response', {}).get('Error', {}).get('Code') or str(e)
+            self._failed.extend((bucket, key, error) for key in keys)
+            return
+        errors = response.get('Errors', [])
+        for item in errors:
+            self._failed.append((bucket, item.get('Key'), item.get('Code') or item.get('Message')))
+        self.deleted += len(keys) - len(errors)
+
+    def flush(self):
+        """
+        Delete all scheduled objects.
+
+        Returns:
+            list: (bucket, key, error code) tuples of the objects that could not be deleted
+                since the previous flush.
+        """
+        pending, self._pending = self._pending, {}
+        for bucket, keys in pending.items():
+            for start in range(0, len(keys), self.batch_size):
+                self._delete(bucket, keys[start:start + self.batch_size])
+        failed, self._failed = self._failed, []
+        if self.requests:
+            print(f"Deleted {self.deleted} originals in {self.requests} DeleteObjects requests.")
+        for bucket, key, error in failed:
+            print(f"Error: Failed to delete original s3://{bucket}/{key}: {error}")
+        self.deleted = 0
+        self.requests = 0
+        return failed
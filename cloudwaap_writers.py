@@ -0,0 +1,440 @@
+import csv
+import io
+import json
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from cloudwaap_log_utils import CloudWAAPProcessor
+
+
+INDEX_SUFFIX = ".idx"
+
+
+def _gzip_member(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class BlockGzipCompressor:
+    """
+    BlockGzipCompressor compresses a stream as a series of independent gzip members of
+    about `block_size` uncompressed bytes each, on a thread pool.
+
+    zlib releases the GIL while compressing, so blocks are compressed in parallel on the
+    vCPUs of larger Lambda functions. The members are emitted in order, and concatenated
+    members form a regular gzip file readable by any gzip tool. Blocks only end between
+    compress() calls, so when those hand over whole events every block holds whole events.
+
+    The compressor keeps an index of (compressed offset, uncompressed offset) per block, so
+    readers can decompress blocks in parallel or start reading in the middle of a file. It
+    has the interface of a zlib compression object.
+    """
+
+    def __init__(self, executor, block_size=1024 * 1024, level=6, max_pending=None, workers=4):
+        """
+        Args:
+            executor (concurrent.futures.Executor): Pool compressing the blocks.
+            block_size (int): Uncompressed size of a block in bytes.
+            level (int): zlib compression level.
+            max_pending (int): Maximum number of blocks queued for compression, bounding memory
+                (by default twice the number of workers).
+            workers (int): Number of threads of the executor.
+        """
+        self.executor = executor
+        self.block_size = max(1, int(block_size))
+        self.level = level
+        self.max_pending = max_pending or 2 * max(1, int(workers))
+        self.index = []
+        self._block = []
+        self._block_bytes = 0
+        self._pending = []
+        self._compressed_offset = 0
+        self._uncompressed_offset = 0
+
+    def compress(self, data):
+        """
+        Add data to the stream and return the compressed blocks completed so far, in order.
+        """
+        self._block.append(data)
+        self._block_bytes += len(data)
+        if self._block_bytes >= self.block_size:
+            self._submit_block()
+        return self._collect(wait=len(self._pending) > self.max_pending)
+
+    def flush(self):
+        """
+        Compress the rest of the stream and return all remaining compressed blocks.
+        """
+        self._submit_block()
+        return self._collect(wait=True, drain=True)
+
+    def _submit_block(self):
+        if not self._block_bytes:
+            return
+        data = b''.join(self._block)
+        self._block = []
+        self._block_bytes = 0
+        self._pending.append((len(data), self.executor.submit(_gzip_member, data, self.level)))
+
+    def _collect(self, wait=False, drain=False):
+        output = []
+        while self._pending:
+            size, future = self._pending[0]
+            if not future.done() and not wait:
+                break
+            member = future.result()
+            self._pending.pop(0)
+            self.index.append((self._compressed_offset, self._uncompressed_offset))
+            self._compressed_offset += len(member)
+            self._uncompressed_offset += size
+            output.append(member)
+            # Waiting only until the queue is short again keeps the pool busy
+            wait = drain or len(self._pending) > self.max_pending
+        return b''.join(output)
+
+    def index_document(self):
+        """
+        Return the block index as a JSON document.
+        """
+        return json.dumps({"format": "block-gzip", "block_size": self.block_size,
+                           "compressed_size": self._compressed_offset,
+                           "uncompressed_size": self._uncompressed_offset,
+                           "blocks": self.index}, separators=(',', ':'))
+
+
+class EventWriter:
+    """
+    EventWriter serializes log events into a local output file as NDJSON, as a JSON array,
+    or one line per event through a formatter (e.g. CEF or LEEF).
+
+    With gzip compression every writer owns an incremental zlib compressor, so events are
+    compressed as they are written and neither the serialized nor the compressed output
+    has to be held in memory. A BlockGzipCompressor can be passed instead, which also
+    writes its block index next to the output (path + INDEX_SUFFIX).
+    """
+
+    BUFFER_SIZE = 256 * 1024
+
+    def __init__(self, path, output_format='ndjson', compression='', formatter=None, compressor=None):
+        """
+        Args:
+            path (str): Local path of the output file.
+            output_format (str): "ndjson", "json", or the name of the formatter's line format.
+            compression (str): "" for plain output or "gzip".
+            formatter (callable): formatter(event) -> str, renders one line per event.
+            compressor: Compressor used instead of `compression`, with the interface of a zlib
+                compression object (e.g. BlockGzipCompressor or a zstd compressor).
+        """
+        self.path = path
+        self.output_format = output_format
+        self._formatter = formatter
+        self.event_count = 0
+        self._file = open(path, 'wb')
+        # wbits=31 produces a gzip stream readable by gzip.open and all common tools
+        self._compressor = compressor
+        if compressor is None and compression == 'gzip':
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        self._separator = b',' if output_format == "json" else b'\n'
+        self._buffer = []
+        self._buffered = 0
+        if output_format == "json":
+            self._append(b'[')
+
+    @property
+    def size(self):
+        """
+        Approximate number of bytes written to the local file so far.
+        """
+        return self._file.tell()
+
+    def _append(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.BUFFER_SIZE:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if data:
+            self._file.write(data)
+
+    def write(self, event, encoded=None):
+        """
+        Append a single event.
+
+        Args:
+            event (dict): The event.
+            encoded (bytes): The event already serialized as UTF-8 JSON, shared by the
+                writers of all destinations receiving the event.
+        """
+        if self.event_count:
+            self._append(self._separator)
+        if self._formatter is not None:
+            self._append(self._formatter(event).encode('utf-8'))
+        else:
+            self._append(encoded if encoded is not None else json.dumps(event).encode('utf-8'))
+        self.event_count += 1
+
+    def write_events(self, events):
+        """
+        Append all events of an iterable.
+        """
+        for event in events:
+            self.write(event)
+
+    def close(self):
+        """
+        Finish the output file so that it can be uploaded.
+        """
+        if self._file.closed:
+            return
+        if self.output_format == "json":
+            self._append(b']')
+        self._flush_buffer()
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush())
+        self._file.close()
+        if isinstance(self._compressor, BlockGzipCompressor):
+            with open(self.path + INDEX_SUFFIX, 'w') as f:
+                f.write(self._compressor.index_document())
+
+
+def flatten_field_names(events, prefix=''):
+    """
+    Return the dotted names of all leaf fields of the events, in the order they are first seen.
+    Nested objects are flattened (empty ones have no leaves); lists are leaves.
+    """
+    names = {}
+    for event in events:
+        for name, value in event.items():
+            if isinstance(value, dict):
+                for nested in flatten_field_names((value,), f"{prefix}{name}."):
+                    names.setdefault(nested, None)
+            else:
+                names.setdefault(prefix + name, None)
+    return list(names)
+
+
+def _cell_getter(path):
+    """
+    Compile a dotted field name into a function returning the field's CSV cell value.
+    """
+    names = path.split('.')
+
+    def cell(value):
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if isinstance(value, (dict, list)):
+            return json.dumps(value)
+        return value
+
+    if len(names) == 1:
+        return lambda event: cell(event.get(path))
+
+    def get(event):
+        value = event
+        for name in names:
+            if not isinstance(value, dict):
+                return ''
+            value = value.get(name)
+        return cell(value)
+    return get
+
+
+class DelimitedEventWriter(EventWriter):
+    """
+    DelimitedEventWriter writes log events as CSV or TSV rows with a fixed column order.
+
+    The columns of a log type are configured, or inferred from the first events written
+    for it (up to INFER_EVENTS) and then reused for all files of the log type in the
+    container. Nested fields are flattened into dotted column names, each compiled once
+    into an accessor. Rows go through a csv.writer into a text buffer that is handed to
+    the (optionally compressed) output in blocks.
+    """
+
+    INFER_EVENTS = 1000
+
+    def __init__(self, path, output_format, compression, log_type, layouts, header=True, compressor=None):
+        """
+        Args:
+            path (str): Local path of the output file.
+            output_format (str): "csv" or "tsv".
+            compression (str): "" for plain output or "gzip".
+            log_type (str): Log type of the events, selecting the columns.
+            layouts (dict): Log type -> list of columns, shared by the writers of a destination.
+                Log types without columns get inferred columns added.
+            header (bool): Whether to write a header row with the column names.
+            compressor: Compressor used instead of `compression`.
+        """
+        super().__init__(path, output_format, compression, compressor=compressor)
+        self.log_type = log_type
+        self.header = header
+        self._layouts = layouts
+        self._text = io.StringIO()
+        self._csv = csv.writer(self._text, delimiter='\t' if output_format == "tsv" else ',',
+                               lineterminator='\n')
+        self._pending = []
+        self._getters = None
+        if layouts.get(log_type):
+            self._start()
+
+    def _start(self):
+        columns = self._layouts.get(self.log_type)
+        if not columns:
+            columns = flatten_field_names(self._pending)
+            if self._pending:
+                self._layouts[self.log_type] = columns
+        self.columns = columns
+        self._getters = tuple(_cell_getter(column) for column in columns)
+        if self.header:
+            self._csv.writerow(columns)
+        pending, self._pending = self._pending, []
+        for event in pending:
+            self._write_row(event)
+
+    def _write_row(self, event):
+        self._csv.writerow([get(event) for get in self._getters])
+        if self._text.tell() >= self.BUFFER_SIZE:
+            self._flush_text()
+
+    def _flush_text(self):
+        self._append(self._text.getvalue().encode('utf-8'))
+        self._text.seek(0)
+        self._text.truncate()
+
+    def write(self, event, encoded=None):
+        """
+        Append a single event. `encoded` is accepted for compatibility with EventWriter.
+        """
+        self.event_count += 1
+        if self._getters is None:
+            # Events are kept until enough of them are seen to infer the columns
+            self._pending.append(event)
+            if len(self._pending) >= self.INFER_EVENTS:
+                self._start()
+            return
+        self._write_row(event)
+
+    def close(self):
+        """
+        Finish the output file so that it can be uploaded.
+        """
+        if self._file.closed:
+            return
+        if self._getters is None:
+            self._start()
+        self._flush_text()
+        super().close()
+
+
+class EventTimeBucketer:
+    """
+    EventTimeBucketer assigns events to fixed-size time buckets (one hour by default)
+    based on the first of the configured timestamp fields that holds a value.
+
+    Parsed values are memoized, since events of one file share a small number of distinct
+    timestamps. Events without a usable timestamp fall into the `default` bucket.
+    """
+
+    CACHE_SIZE = 10000
+
+    def __init__(self, fields, bucket_seconds=3600, default=None):
+        """
+        Args:
+            fields (list): Candidate timestamp field names, in order of preference.
+            bucket_seconds (int): Size of a bucket in seconds.
+            default (datetime): Bucket of events without a timestamp.
+        """
+        self.fields = list(fields)
+        self.bucket_seconds = max(1, int(bucket_seconds))
+        self.default = default
+        self._cache = {}
+
+    def bucket(self, event):
+        """
+        Return the start of the event's bucket as a UTC datetime, or the default bucket.
+        """
+        for field in self.fields:
+            value = event.get(field)
+            if value is None or value == "":
+                continue
+            try:
+                return self._cache[value]
+            except (KeyError, TypeError):
+                pass
+            timestamp = CloudWAAPProcessor.parse_event_timestamp({field: value}, (field,))
+            if timestamp is None:
+                continue
+            epoch = int(timestamp.timestamp())
+            bucket = datetime.fromtimestamp(epoch - epoch % self.bucket_seconds, tz=timezone.utc)
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.clear()
+            try:
+                self._cache[value] = bucket
+            except TypeError:
+                pass
+            return bucket
+        return self.default
+
+
+class PartitionRouter:
+    """
+    PartitionRouter streams events into one EventWriter per partition.
+
+    At most `max_open_writers` writers are open at a time. When another partition needs a
+    writer, the least recently used one is closed and handed to `on_close` (typically to be
+    uploaded), which keeps memory and open files bounded. A partition that receives events
+    after its writer was closed continues in a new part with the next part number.
+    """
+
+    def __init__(self, open_writer, on_close, max_open_writers=8):
+        """
+        Args:
+            open_writer (callable): open_writer(partition, part_number) -> EventWriter.
+            on_close (callable): on_close(partition, part_number, writer), called for every closed writer.
+            max_open_writers (int): Maximum number of writers open at the same time.
+        """
+        self.open_writer = open_writer
+        self.on_close = on_close
+        self.max_open_writers = max(1, int(max_open_writers))
+        self.parts_written = 0
+        self.evictions = 0
+        self._writers = OrderedDict()
+        self._next_part = {}
+
+    def write(self, partition, event, encoded=None):
+        """
+        Write an event to the writer of its partition, opening one if needed.
+        """
+        entry = self._writers.get(partition)
+        if entry is None:
+            if len(self._writers) >= self.max_open_writers:
+                self.evictions += 1
+                self._close_entry(*self._writers.popitem(last=False))
+            part_number = self._next_part.get(partition, 0)
+            self._next_part[partition] = part_number + 1
+            entry = (part_number, self.open_writer(partition, part_number))
+            self._writers[partition] = entry
+        else:
+            self._writers.move_to_end(partition)
+        entry[1].write(event, encoded)
+
+    def _close_entry(self, partition, entry):
+        part_number, writer = entry
+        writer.close()
+        self.parts_written += 1
+        self.on_close(partition, part_number, writer)
+
+    def close(self):
+        """
+        Close all open writers, oldest first.
+        """
+        while self._writers:
+            self._close_entry(*self._writers.popitem(last=False))
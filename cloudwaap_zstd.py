@@ -0,0 +1,224 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import time
+import zlib
+
+from cloudwaap_log_utils import CloudWAAPProcessor
+from cloudwaap_s3 import create_s3_client
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Upper bounds in bytes of the file size classes reported by the benchmark
+SIZE_CLASSES = (4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, None)
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("zstandard module is not available. Add it as a Lambda layer to write zstd output.")
+
+
+class ZstdCodec:
+    """
+    ZstdCodec creates zstd compressors for outputs, optionally with a dictionary trained on
+    sample log files.
+
+    Small files compress poorly because the compressor has no history to refer to; a
+    dictionary supplies that history up front. It is loaded from a local file or an S3
+    object once per container and prepared for the compression level on first use.
+    Consumers need the same dictionary to decompress.
+    """
+
+    def __init__(self, level=3, dictionary='', s3_client=None):
+        """
+        Args:
+            level (int): zstd compression level.
+            dictionary (str): Local path or "s3://bucket/key" URI of a trained dictionary, or "".
+            s3_client: S3 client, required for S3 dictionaries.
+        """
+        self.level = level
+        self.dictionary = dictionary
+        self.s3_client = s3_client
+        self._dictionary_data = None
+
+    def _load_dictionary(self):
+        if self.dictionary.startswith("s3://"):
+            bucket, _, key = self.dictionary[len("s3://"):].partition('/')
+            raw = self.s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+        else:
+            with open(self.dictionary, 'rb') as f:
+                raw = f.read()
+        dictionary = zstandard.ZstdCompressionDict(raw)
+        dictionary.precompute_compress(level=self.level)
+        print(f"Loaded zstd dictionary {self.dictionary} ({len(raw)} bytes, ID {dictionary.dict_id()}).")
+        return dictionary
+
+    def compressobj(self):
+        """
+        Return a new streaming compressor with the zlib compression object interface.
+
+        Raises:
+            ImportError: If zstandard is not available.
+        """
+        _require_zstandard()
+        if self.dictionary and self._dictionary_data is None:
+            self._dictionary_data = self._load_dictionary()
+        if self._dictionary_data is not None:
+            compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._dictionary_data)
+        else:
+            compressor = zstandard.ZstdCompressor(level=self.level)
+        return compressor.compressobj()
+
+
+def _iter_sources(source, max_files, s3_client=None):
+    """
+    Yield the contents of up to max_files Cloud WAAP log files (".json.gz") below a local
+    directory or an "s3://bucket/prefix", read with `s3_client`.
+    """
+    count = 0
+    if source.startswith("s3://"):
+        bucket, _, prefix = source[len("s3://"):].partition('/')
+        list_kwargs = {'Bucket': bucket, 'Prefix': prefix}
+        while True:
+            page = s3_client.list_objects_v2(**list_kwargs)
+            for item in page.get('Contents', []):
+                if not item['Key'].endswith('.json.gz'):
+                    continue
+                yield item['Key'], s3_client.get_object(Bucket=bucket, Key=item['Key'])['Body'].read()
+                count += 1
+                if count >= max_files:
+                    return
+            if not page.get('IsTruncated'):
+                return
+            list_kwargs['ContinuationToken'] = page['NextContinuationToken']
+    for root, _, files in sorted(os.walk(source)):
+        for name in sorted(files):
+            if not name.endswith('.json.gz'):
+                continue
+            with open(os.path.join(root, name), 'rb') as f:
+                yield name, f.read()
+            count += 1
+            if count >= max_files:
+                return
+
+
+def load_samples(source, max_files, s3_client=None):
+    """
+    Convert log files into the NDJSON outputs the function writes for them, as samples.
+
+    Args:
+        source (str): Local directory or "s3://bucket/prefix" of log files.
+        max_files (int): Number of files to read.
+        s3_client: S3 client, required for S3 sources (see cloudwaap_s3.create_s3_client).
+
+    Returns:
+        list: One bytes object per file.
+    """
+    samples = []
+    for name, raw in _iter_sources(source, max_files, s3_client):
+        try:
+            with gzip.open(io.BytesIO(raw), 'rt') as f:
+                events = CloudWAAPProcessor.iter_events(f)
+                samples.append('\n'.join(json.dumps(event) for event in events).encode('utf-8'))
+        except (OSError, EOFError, ValueError) as e:
+            print(f"Skipping {name}: {e}")
+    return samples
+
+
+def train_dictionary(samples, size=112640):
+    """
+    Train a zstd dictionary on sample outputs.
+
+    Returns:
+        bytes: The dictionary.
+    """
+    _require_zstandard()
+    return zstandard.train_dictionary(size, samples).as_bytes()
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def benchmark(samples, level=3, dictionary=None):
+    """
+    Compare gzip, zstd and zstd with a dictionary on sample outputs, per file size class.
+
+    Returns:
+        list: (size class, codec, files, input bytes, output bytes, seconds) tuples.
+    """
+    _require_zstandard()
+    codecs = [("gzip -6", _gzip), (f"zstd -{level}", zstandard.ZstdCompressor(level=level).compress)]
+    if dictionary is not None:
+        dictionary_data = zstandard.ZstdCompressionDict(dictionary)
+        codecs.append((f"zstd -{level} + dictionary",
+                       zstandard.ZstdCompressor(level=level, dict_data=dictionary_data).compress))
+    classes = {}
+    for sample in samples:
+        limit = next(limit for limit in SIZE_CLASSES if limit is None or len(sample) < limit)
+        classes.setdefault(limit, []).append(sample)
+    results = []
+    for limit in SIZE_CLASSES:
+        class_samples = classes.get(limit)
+        if not class_samples:
+            continue
+        label = f"< {limit // 1024} KiB" if limit else f">= {SIZE_CLASSES[-2] // 1024} KiB"
+        for name, compress in codecs:
+            started = time.perf_counter()
+            output_size = sum(len(compress(sample)) for sample in class_samples)
+            results.append((label, name, len(class_samples), sum(map(len, class_samples)), output_size,
+                            time.perf_counter() - started))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train and benchmark zstd dictionaries for Cloud WAAP outputs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="Train a dictionary on historical log files.")
+    train.add_argument("source", help="Local directory or s3://bucket/prefix of .json.gz log files.")
+    train.add_argument("output", help="Path of the dictionary file to write.")
+    train.add_argument("--max-files", type=int, default=1000, help="Number of log files to sample.")
+    train.add_argument("--size", type=int, default=112640, help="Dictionary size in bytes.")
+    bench = commands.add_parser("benchmark", help="Compare gzip and zstd on historical log files.")
+    bench.add_argument("source", help="Local directory or s3://bucket/prefix of .json.gz log files.")
+    bench.add_argument("--dictionary", help="Dictionary file to include in the comparison.")
+    bench.add_argument("--level", type=int, default=3, help="zstd compression level.")
+    bench.add_argument("--max-files", type=int, default=1000, help="Number of log files to compress.")
+    for command in (train, bench):
+        command.add_argument("--s3-client", choices=("boto3", "native"), default="boto3",
+                             help="S3 client reading s3:// sources (boto3 uses its usual credential chain).")
+    args = parser.parse_args(argv)
+
+    s3_client = create_s3_client(args.s3_client) if args.source.startswith("s3://") else None
+    samples = load_samples(args.source, args.max_files, s3_client)
+    if not samples:
+        print(f"No log files found in {args.source}.")
+        return 1
+    if args.command == "train":
+        dictionary = train_dictionary(samples, args.size)
+        with open(args.output, 'wb') as f:
+            f.write(dictionary)
+        print(f"Wrote a {len(dictionary)} byte dictionary trained on {len(samples)} files to {args.output}.")
+        return 0
+
+    dictionary = None
+    if args.dictionary:
+        with open(args.dictionary, 'rb') as f:
+            dictionary = f.read()
+    print(f"{'File size':<12} {'Codec':<24} {'Files':>6} {'Input':>12} {'Output':>12} {'Ratio':>7} {'MB/s':>8}")
+    for label, name, files, input_size, output_size, seconds in benchmark(samples, args.level, dictionary):
+        speed = input_size / seconds / 1e6 if seconds else 0.0
+        print(f"{label:<12} {name:<24} {files:>6} {input_size:>12} {output_size:>12} "
+              f"{input_size / max(1, output_size):>7.2f} {speed:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
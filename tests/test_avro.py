@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from cloudwaap_avro import EXTRA_FIELD, AvroEventWriter, encode_long, encode_string, infer_schema
+
+
+@pytest.mark.parametrize("value, encoded", [
+    (0, b"\x00"), (-1, b"\x01"), (1, b"\x02"), (-64, b"\x7f"), (64, b"\x80\x01"),
+    (8192, b"\x80\x80\x01"), ((1 << 63) - 1, b"\xfe\xff\xff\xff\xff\xff\xff\xff\xff\x01"),
+])
+def test_longs_are_zigzag_varints(value, encoded):
+    # Examples of the Avro specification, plus the largest long
+    assert encode_long(value) == encoded
+
+
+def test_strings_are_length_prefixed_utf8():
+    assert encode_string("foo") == b"\x06foo"
+    assert encode_string("é") == b"\x04\xc3\xa9"
+
+
+def test_schema_types_follow_the_values_of_the_batch():
+    schema = infer_schema("Web-DDoS", [{"a": 1, "b": 1.5, "c": True, "d": "x", "e": {"n": 1}, "bad-name": 1},
+                                       {"a": 2, "b": 2, "c": None}])
+    assert schema["name"] == "Web_DDoS"
+    types = {field["name"]: field["type"] for field in schema["fields"]}
+    assert types == {"a": ["null", "long"], "b": ["null", "double"], "c": ["null", "boolean"],
+                     "d": ["null", "string"], "e": ["null", "string"], EXTRA_FIELD: ["null", "string"]}
+
+
+def write(path, events, schemas=None, **options):
+    writer = AvroEventWriter(str(path), "WAF", {} if schemas is None else schemas, **options)
+    writer.write_events(events)
+    writer.close()
+    return writer
+
+
+def read(path):
+    fastavro = pytest.importorskip("fastavro")
+    with open(path, "rb") as f:
+        reader = fastavro.reader(f)
+        return reader.writer_schema, list(reader)
+
+
+@pytest.mark.parametrize("codec", ["deflate", "null"])
+def test_round_trip_through_an_avro_reader(tmp_path, codec):
+    events = [{"id": i, "ratio": i / 4, "blocked": i % 2 == 0, "uri": f"/p/{i}", "headers": {"h": str(i)}}
+              for i in range(3000)]
+    path = tmp_path / "out.avro"
+    writer = write(path, [dict(event) for event in events], codec=codec, block_size=4096)
+    assert writer.blocks > 1
+    schema, records = read(path)
+    assert schema["name"] == "com.radware.cloudwaap.WAF"
+    assert len(records) == len(events)
+    for event, record in zip(events, records):
+        assert record["id"] == event["id"]
+        assert record["ratio"] == event["ratio"]
+        assert record["blocked"] is event["blocked"]
+        assert record["uri"] == event["uri"]
+        assert json.loads(record["headers"]) == event["headers"]
+        assert record[EXTRA_FIELD] is None
+
+
+def test_values_outside_the_schema_are_kept_in_the_extra_field(tmp_path):
+    schemas = {}
+    write(tmp_path / "first.avro", [{"id": 1, "uri": "/"}], schemas)
+    assert [field["name"] for field in schemas["WAF"]["fields"]] == ["id", "uri", EXTRA_FIELD]
+    # Later files of the log type reuse the schema of the first one
+    write(tmp_path / "second.avro", [{"id": "not a number", "uri": "/a", "new": [1, 2]}], schemas)
+    _, records = read(tmp_path / "second.avro")
+    assert records == [{"id": None, "uri": "/a", EXTRA_FIELD: json.dumps({"id": "not a number", "new": [1, 2]})}]
+
+
+def test_file_without_events_is_readable(tmp_path):
+    write(tmp_path / "empty.avro", [])
+    schema, records = read(tmp_path / "empty.avro")
+    assert records == [] and schema["fields"][-1]["name"] == EXTRA_FIELD
+
+
+def test_unknown_codec_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        AvroEventWriter(str(tmp_path / "out.avro"), "WAF", {}, codec="snappy")
@@ -0,0 +1,75 @@
+import json
+
+from cloudwaap_backfill import BackfillManifest
+
+
+def manifest(path, prefix="logs/", checkpoint_interval=100):
+    return BackfillManifest(str(path), "bucket", prefix, checkpoint_interval=checkpoint_interval)
+
+
+def test_a_missing_manifest_starts_from_the_beginning(tmp_path):
+    loaded = manifest(tmp_path / "missing.json").load()
+    assert loaded.continuation_token is None and loaded.page == 0 and not loaded.complete
+
+
+def test_saved_progress_is_resumed(tmp_path):
+    path = tmp_path / "state" / "manifest.json"
+    first = manifest(path)
+    first.advance("token-1")
+    first.mark_done("logs/a.json.gz")
+    first.mark_failed("logs/b.json.gz")
+    first.save()
+    resumed = manifest(path).load()
+    assert (resumed.continuation_token, resumed.page, resumed.processed) == ("token-1", 1, 1)
+    assert resumed.is_done("logs/a.json.gz") and not resumed.is_done("logs/b.json.gz")
+    assert resumed.failed == ["logs/b.json.gz"] and resumed.failed_count == 1
+
+
+def test_completed_keys_are_written_every_checkpoint_interval(tmp_path):
+    path = tmp_path / "manifest.json"
+    progress = manifest(path, checkpoint_interval=2)
+    progress.mark_done("logs/a.json.gz")
+    assert not path.exists()
+    progress.mark_done("logs/b.json.gz")
+    assert json.loads(path.read_text())["processed"] == 2
+
+
+def test_advancing_to_the_next_page_forgets_the_completed_keys(tmp_path):
+    progress = manifest(tmp_path / "manifest.json")
+    progress.mark_done("logs/a.json.gz")
+    progress.advance("token-2")
+    assert not progress.is_done("logs/a.json.gz")
+    assert progress.processed == 1 and progress.page == 1
+
+
+def test_only_the_last_failed_keys_are_named(tmp_path):
+    progress = manifest(tmp_path / "manifest.json")
+    for index in range(BackfillManifest.MAX_FAILED_KEYS + 20):
+        progress.mark_failed(f"logs/{index}.json.gz")
+    progress.mark_failed("logs/119.json.gz")
+    assert progress.failed_count == BackfillManifest.MAX_FAILED_KEYS + 20
+    assert len(progress.failed) == BackfillManifest.MAX_FAILED_KEYS
+    assert progress.failed[0] == "logs/20.json.gz" and progress.failed[-1] == "logs/119.json.gz"
+
+
+def test_a_finished_backfill_is_remembered(tmp_path):
+    path = tmp_path / "manifest.json"
+    progress = manifest(path)
+    progress.advance("token-1")
+    progress.finish()
+    resumed = manifest(path).load()
+    assert resumed.complete and resumed.continuation_token is None
+
+
+def test_the_manifest_of_another_prefix_is_ignored(tmp_path):
+    path = tmp_path / "manifest.json"
+    other = manifest(path, prefix="other/")
+    other.advance("token-1")
+    loaded = manifest(path).load()
+    assert loaded.continuation_token is None and loaded.page == 0
+
+
+def test_default_locations_are_per_prefix_and_outside_it():
+    location = BackfillManifest.default_location("bucket", "logs/")
+    assert location.startswith("s3://bucket/cloudwaap-backfill/") and location.endswith(".json")
+    assert location != BackfillManifest.default_location("bucket", "other/")
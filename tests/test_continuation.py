@@ -0,0 +1,84 @@
+import io
+import json
+
+import pytest
+
+from cloudwaap_continuation import Continuation, ContinuationStore
+from cloudwaap_log_utils import CloudWAAPProcessor
+
+
+class Context:
+    """A Lambda context whose time runs low after a number of checks."""
+
+    def __init__(self, checks_before_low):
+        self.checks = 0
+        self.checks_before_low = checks_before_low
+
+    def get_remaining_time_in_millis(self):
+        self.checks += 1
+        return 900000 if self.checks <= self.checks_before_low else 1000
+
+
+def run(text, record=None, checks_before_low=1, check_interval=10):
+    continuation = Continuation("bucket", "key", '"etag"', Context(checks_before_low), check_interval=check_interval)
+    if record is not None:
+        assert continuation.restore(record)
+    events = list(continuation.watch(CloudWAAPProcessor.iter_events(io.StringIO(text), chunk_size=64,
+                                                                     cursor=continuation.cursor)))
+    return continuation, events
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps([{"i": i, "pad": "x" * (i % 5)} for i in range(95)], indent=1),
+    "\n".join(json.dumps({"i": i}) for i in range(95)) + "\n",
+])
+def test_resumed_invocations_deliver_every_event_exactly_once(text):
+    delivered, record, invocations = [], None, 0
+    while True:
+        continuation, events = run(text, record)
+        delivered.extend(event["i"] for event in events)
+        invocations += 1
+        if not continuation.stopped:
+            break
+        record = continuation.to_record()
+        assert record["segment"] == invocations
+    assert delivered == list(range(95))
+    assert continuation.events == 95
+    assert invocations > 2
+
+
+def test_a_stop_at_the_end_of_the_file_completes_it():
+    text = json.dumps([{"i": i} for i in range(20)])
+    continuation, events = run(text, checks_before_low=1)
+    assert len(events) == 20 and not continuation.stopped
+    continuation, events = run(text, checks_before_low=0, check_interval=20)
+    assert len(events) == 20 and not continuation.stopped
+
+
+def test_without_a_context_the_stream_is_never_stopped():
+    continuation = Continuation("bucket", "key", check_interval=1)
+    assert len(list(continuation.watch(iter(range(50))))) == 50
+    assert not continuation.stopped and continuation.events == 50
+
+
+def test_records_of_another_object_or_version_are_ignored():
+    continuation, _ = run(json.dumps([{"i": i} for i in range(30)]))
+    record = continuation.to_record()
+    assert record["etag"] == "etag"
+    assert not Continuation("bucket", "key", '"other"').restore(record)
+    assert not Continuation("bucket", "other", '"etag"').restore(record)
+    assert not Continuation("bucket", "key", '"etag"').restore(dict(record, version=0))
+    restored = Continuation("bucket", "key", '"etag"')
+    assert restored.restore(record) and restored.resumed
+    assert restored.cursor == record["cursor"] and restored.events == record["events"]
+
+
+def test_local_store_saves_loads_and_deletes_records(tmp_path):
+    store = ContinuationStore(str(tmp_path / "records"))
+    assert store.load("bucket", "key") is None
+    record = {"bucket": "bucket", "key": "key", "segment": 1}
+    store.save(record)
+    assert store.load("bucket", "key") == record
+    assert store.load("bucket", "other") is None
+    store.delete("bucket", "key")
+    assert store.load("bucket", "key") is None
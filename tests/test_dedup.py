@@ -0,0 +1,136 @@
+import io
+import random
+
+import pytest
+
+from cloudwaap_dedup import EventDeduplicator, RotatingBloomFilter
+
+
+def fingerprints(count, seed):
+    rng = random.Random(seed)
+    return [rng.getrandbits(64) for _ in range(count)]
+
+
+def test_measured_false_positive_rate_stays_near_the_target():
+    bloom = RotatingBloomFilter(capacity=10000, error_rate=0.01, generation_seconds=60, generations=1)
+    added = fingerprints(10000, seed=1)
+    bloom.add_many(added, now=0)
+    assert all(value in bloom for value in added)
+    unseen = fingerprints(50000, seed=2)
+    measured = sum(value in bloom for value in unseen) / len(unseen)
+    assert 0.005 < measured < 0.015
+    assert bloom.false_positive_rate() == pytest.approx(0.01, rel=0.2)
+
+
+def test_generations_leave_the_window():
+    bloom = RotatingBloomFilter(capacity=100, error_rate=0.01, generation_seconds=10, generations=2)
+    bloom.add_many([1, 2], now=0)
+    bloom.add_many([3], now=12)
+    bloom.expire(now=19)
+    assert 1 in bloom and 3 in bloom
+    bloom.expire(now=20)
+    assert 1 not in bloom and 3 in bloom
+    bloom.expire(now=30)
+    assert 3 not in bloom
+
+
+def test_serialized_filters_round_trip_and_reject_other_parameters():
+    bloom = RotatingBloomFilter(capacity=100, error_rate=0.01, generation_seconds=10, generations=2)
+    bloom.add_many([1, 2], now=0)
+    bloom.add_many([3], now=10)
+    data = bloom.to_bytes()
+    copy = RotatingBloomFilter(capacity=100, error_rate=0.01, generation_seconds=10, generations=2)
+    assert copy.load_bytes(data)
+    assert all(value in copy for value in (1, 2, 3))
+    assert not copy.load_bytes(data[:-1])
+    assert not RotatingBloomFilter(200, 0.01, 10, 2).load_bytes(data)
+    assert not RotatingBloomFilter(100, 0.01, 20, 2).load_bytes(data)
+
+
+def test_events_are_dropped_only_after_an_earlier_file_was_committed(tmp_path):
+    dedup = EventDeduplicator({"*": "raw"}, state_dir=str(tmp_path), save_interval=0)
+    events = [{"id": 1}, {"id": 1}, {"id": 2}]
+    assert list(dedup.apply(iter(events), "WAF", "tenant")) == events
+    dedup.commit()
+    assert list(dedup.apply(iter([{"id": 2}, {"id": 3}]), "WAF", "tenant")) == [{"id": 3}]
+    assert (dedup.checked, dedup.duplicates) == (2, 1)
+    # Tenants have filters of their own
+    assert list(dedup.apply(iter([{"id": 1}]), "WAF", "other")) == [{"id": 1}]
+
+
+def test_fields_select_what_identifies_an_event(tmp_path):
+    dedup = EventDeduplicator({"Access": ["transId"]}, state_dir=str(tmp_path))
+    assert dedup.applies_to("Access") and not dedup.applies_to("WAF")
+    list(dedup.apply(iter([{"transId": "a", "time": 1}]), "Access", "tenant"))
+    dedup.commit()
+    assert list(dedup.apply(iter([{"transId": "a", "time": 2}]), "Access", "tenant")) == []
+
+
+def test_rollback_forgets_the_fingerprints_after_the_savepoint(tmp_path):
+    dedup = EventDeduplicator({"*": "raw"}, state_dir=str(tmp_path))
+    list(dedup.apply(iter([{"id": 1}]), "WAF", "tenant"))
+    savepoint = dedup.savepoint()
+    list(dedup.apply(iter([{"id": 2}]), "WAF", "tenant"))
+    dedup.rollback(savepoint)
+    dedup.commit()
+    assert list(dedup.apply(iter([{"id": 1}, {"id": 2}]), "WAF", "tenant")) == [{"id": 2}]
+    dedup.rollback()
+    assert (dedup.checked, dedup.duplicates) == (0, 0)
+    dedup.commit()
+    assert list(dedup.apply(iter([{"id": 2}]), "WAF", "tenant")) == [{"id": 2}]
+
+
+def test_local_filters_are_persisted_per_tenant(tmp_path):
+    dedup = EventDeduplicator({"*": "raw"}, state_dir=str(tmp_path), save_interval=0)
+    list(dedup.apply(iter([{"id": 1}]), "WAF", "tenant/a"))
+    dedup.commit()
+    assert (tmp_path / "dedup" / "tenant_a.bloom").exists()
+    restarted = EventDeduplicator({"*": "raw"}, state_dir=str(tmp_path))
+    assert list(restarted.apply(iter([{"id": 1}]), "WAF", "tenant/a")) == []
+
+
+class FakeS3Error(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """An in-memory bucket honouring If-Match, If-None-Match and conditional reads."""
+
+    def __init__(self):
+        self.objects = {}
+        self.puts = 0
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if (Bucket, Key) not in self.objects:
+            raise FakeS3Error('NoSuchKey')
+        body, etag = self.objects[(Bucket, Key)]
+        if IfNoneMatch == etag:
+            raise FakeS3Error('304')
+        return {'Body': io.BytesIO(body), 'ETag': etag}
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None):
+        current = self.objects.get((Bucket, Key))
+        if (IfNoneMatch == '*' and current is not None) or (IfMatch is not None and (current is None or current[1] != IfMatch)):
+            raise FakeS3Error('PreconditionFailed')
+        self.puts += 1
+        etag = f'"{self.puts}"'
+        self.objects[(Bucket, Key)] = (Body, etag)
+        return {'ETag': etag}
+
+
+def test_concurrent_s3_writes_merge_each_others_fingerprints():
+    s3 = FakeS3Client()
+    first = EventDeduplicator({"*": "raw"}, "s3://bucket/dedup/", s3_client=s3, save_interval=0)
+    second = EventDeduplicator({"*": "raw"}, "s3://bucket/dedup/", s3_client=s3, save_interval=0)
+    # Both load the (missing) filter before either writes, so the second write conflicts
+    list(first.apply(iter([{"id": 1}]), "WAF", "tenant"))
+    list(second.apply(iter([{"id": 2}]), "WAF", "tenant"))
+    first.commit()
+    second.commit()
+    assert s3.puts == 2
+    third = EventDeduplicator({"*": "raw"}, "s3://bucket/dedup/", s3_client=s3)
+    assert list(third.apply(iter([{"id": 1}, {"id": 2}, {"id": 3}]), "WAF", "tenant")) == [{"id": 3}]
+    # A refresh picks up fingerprints written by another container since the last read
+    assert list(first.apply(iter([{"id": 2}]), "WAF", "tenant")) == []
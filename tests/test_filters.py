@@ -0,0 +1,131 @@
+import pytest
+
+from cloudwaap_filters import EventFilter, KeyFilter, compile_filter_expression
+
+
+def matches(expression, event):
+    return compile_filter_expression(expression)(event)
+
+
+def test_and_binds_tighter_than_or():
+    expression = "a == 1 or b == 1 and c == 1"
+    assert matches(expression, {"a": 1, "b": 0, "c": 0})
+    assert not matches(expression, {"a": 0, "b": 1, "c": 0})
+    assert matches(expression, {"a": 0, "b": 1, "c": 1})
+
+
+def test_parentheses_override_precedence():
+    expression = "(a == 1 or b == 1) and c == 1"
+    assert not matches(expression, {"a": 1, "b": 0, "c": 0})
+    assert matches(expression, {"a": 1, "b": 0, "c": 1})
+
+
+def test_not_applies_to_the_next_term_only():
+    expression = "not a == 1 and b == 1"
+    assert matches(expression, {"a": 0, "b": 1})
+    assert not matches(expression, {"a": 1, "b": 1})
+    assert not matches(expression, {"a": 0, "b": 0})
+    assert matches("not (a == 1 and b == 1)", {"a": 1, "b": 0})
+    assert matches("not not a == 1", {"a": 1})
+
+
+def test_numbers_compare_numerically_with_strings_and_numbers():
+    assert matches("status >= 400", {"status": "404"})
+    assert matches("status >= 400", {"status": 500})
+    assert not matches("status >= 400", {"status": "200"})
+    assert not matches("status >= 400", {"status": "n/a"})
+    assert not matches("status >= 400", {})
+    assert matches("status == 200", {"status": "200.0"})
+    assert matches("latency < 1.5", {"latency": 1})
+
+
+def test_strings_compare_as_text():
+    assert matches("action == 'Allowed'", {"action": "Allowed"})
+    assert matches('action != "Allowed"', {"action": "Blocked"})
+    assert matches("action == 'It\\'s'", {"action": "It's"})
+
+
+def test_in_and_not_in():
+    assert matches("method in ['GET', 'HEAD']", {"method": "HEAD"})
+    assert not matches("method in ['GET', 'HEAD']", {"method": "POST"})
+    assert matches("method not in ['GET', 'HEAD']", {"method": "POST"})
+    assert matches("status in [200, 304]", {"status": 304})
+
+
+def test_regular_expressions_keep_backslashes():
+    expression = "uri ~ '\\.(css|js)$'"
+    assert matches(expression, {"uri": "/static/app.js"})
+    assert not matches(expression, {"uri": "/static/appjs"})
+    assert not matches(expression, {})
+    assert matches("uri !~ '^/api/'", {"uri": "/static"})
+    assert matches("uri !~ '^/api/'", {})
+
+
+def test_null_and_booleans():
+    assert matches("country == null", {})
+    assert matches("country != null", {"country": "DE"})
+    assert matches("blocked == true", {"blocked": True})
+    assert matches("blocked == true", {"blocked": "TRUE"})
+    assert matches("blocked != false", {"blocked": True})
+
+
+def test_dotted_names_reach_into_nested_objects():
+    assert matches("request.method == 'GET'", {"request": {"method": "GET"}})
+    assert not matches("request.method == 'GET'", {"request": "GET"})
+    assert matches("request.method == null", {})
+
+
+@pytest.mark.parametrize("expression, message", [
+    ("action ==", "expected string or number or name, found end of expression"),
+    ("action == 'a' 'b'", "unexpected ''b''"),
+    ("action = 'a'", "at position 7"),
+    ("(action == 'a'", "expected ), found end of expression"),
+    ("action == Allowed", "unknown value 'Allowed'"),
+    ("action == 'a' $", "at position 14"),
+    ("status > null", "Operator '>' cannot be used with null"),
+    ("blocked < true", "Operator '<' cannot be used with booleans"),
+    ("action < 'a'", "Operator '<' requires a number"),
+    ("uri ~ 5", "'~' requires a string pattern"),
+    ("uri ~ '('", "Invalid regular expression"),
+    ("method in []", "expected string or number or name, found ']'"),
+])
+def test_invalid_expressions_are_rejected_with_their_reason(expression, message):
+    with pytest.raises(ValueError) as error:
+        compile_filter_expression(expression)
+    assert message in str(error.value)
+
+
+def test_event_filter_drops_and_projects_per_log_type():
+    event_filter = EventFilter(projections={"Access": {"keep": ["action", "uri"]}, "*": {"drop": ["headers"]}},
+                               filters={"Access": ["uri ~ '\\.css$'"], "WAF": "severity == 'Low'"})
+    access = [{"action": "Allowed", "uri": "/a.css", "ip": "1"}, {"action": "Allowed", "uri": "/a", "ip": "1"}]
+    assert list(event_filter.apply(iter(access), "Access")) == [{"action": "Allowed", "uri": "/a"}]
+    waf = [{"severity": "Low", "headers": "x"}, {"severity": "High", "headers": "x"}]
+    assert list(event_filter.apply(iter(waf), "WAF")) == [{"severity": "High"}]
+    dropped, saved = event_filter.take_stats()
+    assert dropped == 2 and saved > 0
+    assert event_filter.take_stats() == (0, 0)
+    assert not EventFilter().applies_to("Bot")
+
+
+def test_projection_needs_exactly_one_mode():
+    with pytest.raises(ValueError):
+        EventFilter(projections={"WAF": {"keep": ["a"], "drop": ["b"]}})
+
+
+def test_key_filter_allows_and_denies_by_key_attributes():
+    key_filter = KeyFilter(allow=["tenant == 'acme'"], deny=["logType == 'Access'", "extension == '.txt'"])
+    waf = "cloudwaap/acme/app-1/WAF/rdwr_event_acme_shop_20241010H101500_1.json.gz"
+    assert key_filter.allows(waf)
+    assert not key_filter.allows("cloudwaap/acme/rdwr_log_acme_20241010H101500_1.json.gz")
+    assert not key_filter.allows("cloudwaap/acme/test.txt")
+    assert not key_filter.allows(waf.replace("acme", "other"))
+    assert key_filter.take_stats() == 3
+    assert KeyFilter(allow=["key ~ '/WAF/'"]).allows(waf)
+
+
+def test_key_filter_rejects_unknown_attributes():
+    with pytest.raises(ValueError) as error:
+        KeyFilter(deny=["logtype == 'Access'"])
+    assert "unknown field 'logtype'" in str(error.value)
+    assert "logType" in str(error.value)
@@ -0,0 +1,40 @@
+from cloudwaap_iprange import IPRangeEnricher, IPRangeTable
+
+
+def write_table(tmp_path):
+    path = tmp_path / "ranges.csv"
+    path.write_text("start,end,country,asn\n"
+                    "10.0.0.0,10.0.0.255,DE,64500\n"
+                    "2001:db8::,2001:db8::ffff,FR,64501\n")
+    return str(path)
+
+
+def test_lookup_finds_ipv4_and_ipv6_ranges(tmp_path):
+    table = IPRangeTable.load(write_table(tmp_path))
+    assert table.lookup("10.0.0.7") == ("DE", "64500")
+    assert table.lookup("2001:db8::1") == ("FR", "64501")
+    assert table.lookup("10.0.1.0") is None
+    assert table.lookup("not an ip") is None
+
+
+def test_binary_table_matches_csv_table(tmp_path):
+    table = IPRangeTable.load(write_table(tmp_path))
+    binary_path = str(tmp_path / "ranges.bin")
+    table.write_binary(binary_path)
+    mapped = IPRangeTable.load(binary_path)
+    for ip in ("10.0.0.0", "10.0.0.255", "9.255.255.255", "2001:db8::ffff", "2001:db9::"):
+        assert mapped.lookup(ip) == table.lookup(ip)
+
+
+def test_enrich_skips_values_that_are_not_addresses(tmp_path):
+    enricher = IPRangeEnricher(write_table(tmp_path), ["sourceIp", "clientIp"], {"country": "geoCountry"})
+    events = [
+        {"sourceIp": ["10.0.0.1"], "clientIp": "10.0.0.2"},
+        {"sourceIp": {"ip": "10.0.0.1"}},
+        {"sourceIp": True},
+        {"sourceIp": "10.0.0.3"},
+        {"sourceIp": "192.0.2.1"},
+    ]
+    enriched = list(enricher.enrich(iter(events)))
+    assert [event.get("geoCountry") for event in enriched] == ["DE", None, None, "DE", None]
+    assert enricher.misses == 3
@@ -0,0 +1,59 @@
+import pytest
+
+from cloudwaap_redaction import IPPseudonymizer, Redactor, compile_redaction_patterns
+
+
+def test_patterns_mask_the_first_group_or_the_whole_match():
+    redact = compile_redaction_patterns([r"token=(\w+)", r"\d{4}-\d{4}-\d{4}-\d{4}"], "****")
+    assert redact("a?token=abc123&card=1234-5678-9012-3456") == "a?token=****&card=****"
+    assert redact("nothing to hide") == "nothing to hide"
+
+
+def test_leading_flags_stay_scoped_to_their_pattern():
+    redact = compile_redaction_patterns([r"(?i)password=(\S+)", r"Secret"], "x")
+    assert redact("PASSWORD=hunter2 secret Secret") == "PASSWORD=x secret x"
+
+
+def test_invalid_patterns_are_rejected():
+    with pytest.raises(ValueError, match="Invalid redaction pattern"):
+        compile_redaction_patterns(["("], "x")
+
+
+def test_pseudonyms_are_stable_keyed_and_prefixed():
+    pseudonymizer = IPPseudonymizer("key", length=8)
+    first = pseudonymizer.pseudonymize("192.0.2.1")
+    assert first == pseudonymizer.pseudonymize("192.0.2.1")
+    assert first.startswith("ip-") and len(first) == 11
+    assert first != pseudonymizer.pseudonymize("192.0.2.2")
+    assert first != IPPseudonymizer("other key", length=8).pseudonymize("192.0.2.1")
+    with pytest.raises(ValueError):
+        IPPseudonymizer("")
+
+
+def test_redactor_applies_fields_patterns_and_pseudonyms_per_log_type():
+    redactor = Redactor(patterns={"WAF": {"request.uri": [r"token=(\w+)"]}},
+                        fields={"*": ["cookie"]},
+                        ip_fields=["sourceIp"], pseudonymizer=IPPseudonymizer("key"))
+    event = {"request": {"uri": "/?token=abc"}, "cookie": {"a": 1}, "sourceIp": "192.0.2.1", "other": "kept"}
+    redacted, = redactor.apply(iter([event]), "WAF")
+    assert redacted["request"]["uri"] == "/?token=****"
+    assert redacted["cookie"] == "****"
+    assert redacted["sourceIp"].startswith("ip-")
+    assert redacted["other"] == "kept"
+    # Missing and non-string values are left alone
+    redacted, = redactor.apply(iter([{"request": "GET", "sourceIp": None}]), "WAF")
+    assert redacted == {"request": "GET", "sourceIp": None}
+
+
+def test_redactor_without_operations_returns_the_stream_unchanged():
+    redactor = Redactor(fields={"WAF": ["cookie"]})
+    assert redactor.plan("Access") is None
+    assert not redactor.applies_to("Access")
+    events = iter([{"cookie": "c"}])
+    assert redactor.apply(events, "Access") is events
+    assert redactor.applies_to("WAF")
+
+
+def test_ip_fields_require_a_pseudonymizer():
+    with pytest.raises(ValueError):
+        Redactor(ip_fields=["sourceIp"])